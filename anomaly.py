@@ -0,0 +1,267 @@
+# anomaly.py
+
+import math
+import datetime
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from config import EMOTIONS_NAMES
+from storage import TIMESTAMP_FORMAT
+
+
+class EwmaState:
+    """單一看板、單一情感的指數加權平均與變異數，更新為 O(1) 時間與空間。"""
+
+    __slots__ = ('mean', 'var', 'count', 'last_hour')
+
+    def __init__(self, mean: float = 0.0, var: float = 0.0, count: int = 0, last_hour: str = None):
+        self.mean = mean
+        self.var = var
+        self.count = count
+        self.last_hour = last_hour
+
+    def update(self, value: float, alpha: float):
+        # 遞迴形式等同於 EW(x^2) - EW(x)^2，與 backfill 的向量化計算一致
+        if self.count == 0:
+            self.mean, self.var = value, 0.0
+        else:
+            diff = value - self.mean
+            increment = alpha * diff
+            self.mean += increment
+            self.var = (1 - alpha) * (self.var + diff * increment)
+        self.count += 1
+
+
+class SpikeDetector:
+    """
+    以 EWMA z-score 偵測每小時情感序列的突增。
+
+    每個 (看板, 情感) 維護一個 EwmaState。新的一小時數值與「更新前」的平均比較：
+    z = (x - mean) / max(std, min_std)；z 超過 threshold 且已累積 warmup 小時時發出警示。
+    文章數少於 min_articles 的小時仍會更新狀態，但不發出警示，避免少量文章造成誤報。
+    """
+
+    def __init__(self, alpha: float = 0.1, threshold: float = 3.0, warmup: int = 24,
+                 min_std: float = 0.05, min_articles: int = 3):
+        self.alpha = alpha
+        self.threshold = threshold
+        self.warmup = warmup
+        self.min_std = min_std
+        self.min_articles = min_articles
+        self.states = {}
+
+    def state(self, board: str, emotion: str) -> EwmaState:
+        return self.states.setdefault((board, emotion), EwmaState())
+
+    def copy(self) -> 'SpikeDetector':
+        """複製參數與狀態；對副本的更新不影響原本的偵測器。"""
+        clone = SpikeDetector(self.alpha, self.threshold, self.warmup, self.min_std, self.min_articles)
+        clone.states = {key: EwmaState(s.mean, s.var, s.count, s.last_hour) for key, s in self.states.items()}
+        return clone
+
+    def update(self, board: str, hour, values: dict, article_count: int = None) -> list:
+        """
+        以一小時的情感平均分數更新狀態。已處理過的小時會被忽略，因此重複餵入是安全的。
+
+        返回:
+            警示字典列表
+        """
+        hour = pd.to_datetime(hour).strftime(TIMESTAMP_FORMAT)
+        alerts = []
+        for emotion in EMOTIONS_NAMES:
+            if emotion not in values:
+                continue
+            state = self.state(board, emotion)
+            if state.last_hour is not None and hour <= state.last_hour:
+                continue
+            value = float(values[emotion])
+            std = max(math.sqrt(max(state.var, 0.0)), self.min_std)
+            zscore = (value - state.mean) / std
+            enough_articles = article_count is None or article_count >= self.min_articles
+            if state.count >= self.warmup and zscore > self.threshold and enough_articles:
+                alerts.append({
+                    'board': board, 'emotion': emotion, 'hour': hour, 'value': value,
+                    'baseline': state.mean, 'zscore': zscore,
+                })
+            state.update(value, self.alpha)
+            state.last_hour = hour
+        return alerts
+
+    def backfill(self, board: str, hourly: pd.DataFrame) -> list:
+        """
+        以向量化方式處理整段歷史序列，結果與逐小時呼叫 update() 相同，並將狀態設為序列結尾。
+
+        參數:
+            board: 看板名稱
+            hourly: 以小時為索引的情感平均分數；可含 article_count 欄位
+
+        返回:
+            警示字典列表
+        """
+        if hourly.empty:
+            return []
+        hourly = hourly.sort_index()
+        hours = pd.to_datetime(hourly.index).strftime(TIMESTAMP_FORMAT)
+        counts = hourly['article_count'].to_numpy() if 'article_count' in hourly.columns else None
+        positions = np.arange(len(hourly))
+
+        alerts = []
+        for emotion in EMOTIONS_NAMES:
+            if emotion not in hourly.columns:
+                continue
+            values = hourly[emotion].astype(float)
+            mean = values.ewm(alpha=self.alpha, adjust=False).mean()
+            var = (values ** 2).ewm(alpha=self.alpha, adjust=False).mean() - mean ** 2
+            previous_mean = mean.shift(1).to_numpy()
+            previous_std = np.maximum(np.sqrt(var.clip(lower=0).shift(1).to_numpy()), self.min_std)
+            zscore = (values.to_numpy() - previous_mean) / previous_std
+
+            flagged = (positions >= self.warmup) & (zscore > self.threshold)
+            if counts is not None:
+                flagged &= counts >= self.min_articles
+            for i in np.flatnonzero(flagged):
+                alerts.append({
+                    'board': board, 'emotion': emotion, 'hour': hours[i], 'value': float(values.iloc[i]),
+                    'baseline': float(previous_mean[i]), 'zscore': float(zscore[i]),
+                })
+
+            self.states[(board, emotion)] = EwmaState(
+                mean=float(mean.iloc[-1]), var=float(max(var.iloc[-1], 0.0)),
+                count=len(values), last_hour=hours[-1]
+            )
+        return alerts
+
+
+# --- 持久化 ---
+
+def ensure_anomaly_schema(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS anomaly_state (
+            board TEXT NOT NULL,
+            emotion TEXT NOT NULL,
+            mean REAL NOT NULL,
+            var REAL NOT NULL,
+            count INTEGER NOT NULL,
+            last_hour TEXT,
+            PRIMARY KEY (board, emotion)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS emotion_alerts (
+            board TEXT NOT NULL,
+            emotion TEXT NOT NULL,
+            hour TEXT NOT NULL,
+            value REAL NOT NULL,
+            baseline REAL NOT NULL,
+            zscore REAL NOT NULL,
+            created_at TEXT NOT NULL,
+            PRIMARY KEY (board, emotion, hour)
+        )
+    """)
+    conn.commit()
+
+
+def load_state(conn: sqlite3.Connection, detector: SpikeDetector, board: str) -> bool:
+    """將看板的偵測狀態載入 detector；回傳是否有既存狀態。"""
+    rows = conn.execute(
+        "SELECT emotion, mean, var, count, last_hour FROM anomaly_state WHERE board = ?", (board,)
+    ).fetchall()
+    for emotion, mean, var, count, last_hour in rows:
+        detector.states[(board, emotion)] = EwmaState(mean, var, count, last_hour)
+    return bool(rows)
+
+
+def save_state(conn: sqlite3.Connection, detector: SpikeDetector, board: str, alerts: list,
+               since: str = '') -> list:
+    """
+    在同一個交易內寫入看板的偵測狀態與警示。
+
+    alerts 為 since（含）之後所有小時重新計算的完整結果：既有警示中不在 alerts 內的會被移除
+    （文章補齊後不再構成突增），仍存在的更新數值並保留原本的建立時間。
+
+    返回:
+        先前沒有的新警示
+    """
+    created_at = datetime.datetime.now().strftime(TIMESTAMP_FORMAT)
+    with conn:
+        conn.executemany(
+            "INSERT INTO anomaly_state (board, emotion, mean, var, count, last_hour) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (board, emotion) DO UPDATE SET mean = excluded.mean, var = excluded.var, "
+            "count = excluded.count, last_hour = excluded.last_hour",
+            [(b, emotion, s.mean, s.var, s.count, s.last_hour)
+             for (b, emotion), s in detector.states.items() if b == board]
+        )
+        existing = set(conn.execute(
+            "SELECT emotion, hour FROM emotion_alerts WHERE board = ? AND hour >= ?", (board, since)
+        ))
+        computed = {(a['emotion'], a['hour']) for a in alerts}
+        conn.executemany(
+            "DELETE FROM emotion_alerts WHERE board = ? AND emotion = ? AND hour = ?",
+            [(board, emotion, hour) for emotion, hour in existing - computed]
+        )
+        conn.executemany(
+            "INSERT INTO emotion_alerts (board, emotion, hour, value, baseline, zscore, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (board, emotion, hour) DO UPDATE SET value = excluded.value, "
+            "baseline = excluded.baseline, zscore = excluded.zscore",
+            [(a['board'], a['emotion'], a['hour'], a['value'], a['baseline'], a['zscore'], created_at)
+             for a in alerts]
+        )
+    return [a for a in alerts if (a['emotion'], a['hour']) not in existing]
+
+
+def update_board_alerts(conn: sqlite3.Connection, board: str, detector: SpikeDetector, now=None,
+                        recheck_hours: int = 6) -> list:
+    """
+    以看板的完整小時更新偵測器並保存警示。
+
+    工作者的文章批次亂序寫入、儀表板也只抓取部分文章，最近的小時之後可能還會補進文章。
+    因此只有早於 recheck_hours 小時前的小時會固定進 EWMA 狀態（anomaly_state）；最近 recheck_hours
+    小時每次都從固定狀態的副本以當下的資料重新計算，其警示會隨文章補齊而更新或撤回。
+    超過 recheck_hours 才補進的文章不會再影響偵測結果。
+
+    第一次執行（沒有既存狀態）時以 backfill 一次處理固定部分的全部歷史；之後只讀取
+    固定狀態之後、目前這個尚未結束的小時之前的資料，每次的成本與 recheck_hours 成正比。
+
+    返回:
+        先前沒有的新警示字典列表
+    """
+    from query import aggregate_emotions
+
+    ensure_anomaly_schema(conn)
+    now = pd.Timestamp(now or datetime.datetime.now()).floor('h')
+    settle_before = now - pd.Timedelta(hours=recheck_hours)
+
+    has_state = load_state(conn, detector, board)
+    alerts = [] if has_state else detector.backfill(
+        board, aggregate_emotions(conn, board, group_by='hour', end=settle_before)
+    )
+    last_hours = [s.last_hour for (b, _), s in detector.states.items() if b == board and s.last_hour]
+    start = pd.to_datetime(min(last_hours)) + pd.Timedelta(hours=1) if last_hours else None
+    # 從 since 起的小時本次全部重新計算，其既有警示以本次結果為準
+    since = start.strftime(TIMESTAMP_FORMAT) if has_state and start is not None else ''
+
+    hourly = aggregate_emotions(conn, board, group_by='hour', start=start, end=now)
+    settled = pd.to_datetime(hourly.index) < settle_before
+    for hour, row in hourly[settled].iterrows():
+        alerts.extend(detector.update(board, hour, row.to_dict(), int(row['article_count'])))
+    # 最近的小時只在副本上計算，不寫回 anomaly_state
+    recent = detector.copy()
+    for hour, row in hourly[~settled].iterrows():
+        alerts.extend(recent.update(board, hour, row.to_dict(), int(row['article_count'])))
+
+    return save_state(conn, detector, board, alerts, since)
+
+
+def load_alerts(conn: sqlite3.Connection, board: str, since=None, limit: int = 50) -> pd.DataFrame:
+    """讀取看板的警示，依時間由新到舊排序。"""
+    ensure_anomaly_schema(conn)
+    since = pd.to_datetime(since).strftime(TIMESTAMP_FORMAT) if since is not None else ''
+    df = pd.read_sql(
+        "SELECT hour, emotion, value, baseline, zscore FROM emotion_alerts "
+        "WHERE board = ? AND hour >= ? ORDER BY hour DESC, zscore DESC LIMIT ?",
+        conn, params=(board, since, limit), parse_dates=['hour']
+    )
+    return df
@@ -5,9 +5,16 @@ import pandas as pd
 import datetime
 import plotly.graph_objects as go
 from data_fetcher import get_ptt_articles_from_db
-from sentiment_analyzer import get_sentiment_model, analyze_sentiment_batch # 導入你更新後的函數
-from config import EMOTIONS_NAMES
-import sqlite3
+from sentiment_analyzer import get_sentiment_model, get_active_lexicon, analyze_sentiment_batch, analyze_push_batch, load_repost_history # 導入你更新後的函數
+from config import EMOTIONS_NAMES, DB_POOL_SIZE
+from storage import (
+    ARTICLE_COLUMNS, board_table, ensure_board_schema, upsert_articles, lookup_article_ids, store_article_pushes
+)
+from query import aggregate_emotions, query_articles
+from search import keyword_emotion_trend, search_articles
+from anomaly import load_alerts
+from maintenance import maintain_board
+from db import get_database
 
 # --- Streamlit 應用程式配置 ---
 st.set_page_config(
@@ -97,7 +104,7 @@ def plot_radar_chart(data_row: pd.Series, emotions: list) -> go.Figure:
     )
     return fig
 
-def display_analysis_results(selected_board, hourly_data, articles_df, mode='exist'):
+def display_analysis_results(selected_board, hourly_data, articles_df, mode='exist', push_hourly_data=None):
     """顯示分析結果的統一函數"""
     min_time = hourly_data.index.min().to_pydatetime()
     max_time = hourly_data.index.max().to_pydatetime()
@@ -128,6 +135,18 @@ def display_analysis_results(selected_board, hourly_data, articles_df, mode='exi
     st.subheader("🌐 即時情感八角向量圖")
     st.plotly_chart(plot_radar_chart(closest_time_data, EMOTIONS_NAMES), use_container_width=True)
 
+    alerts_df = load_alerts_from_sqlite(selected_board, since=min_time)
+    if not alerts_df.empty:
+        st.subheader("🚨 情感突增警示")
+        for _, alert in alerts_df.head(3).iterrows():
+            st.warning(
+                f"{alert['hour'].strftime('%Y/%m/%d %H:00')} "
+                f"{EMOTION_NAMES_ZH.get(alert['emotion'], alert['emotion'])} {EMOTION_EMOJIS.get(alert['emotion'], '')} "
+                f"突增至 {alert['value']:.3f}（基準 {alert['baseline']:.3f}，z = {alert['zscore']:.1f}）"
+            )
+        if len(alerts_df) > 3:
+            st.dataframe(alerts_df, use_container_width=True, height=200)
+
     st.subheader("📈 過去七天每小時情感分數 (表格)")
     st.dataframe(hourly_data.reset_index().rename(columns={'index': '時間'}), use_container_width=True, height=300)
     
@@ -140,42 +159,168 @@ def display_analysis_results(selected_board, hourly_data, articles_df, mode='exi
         help="下載當前看板的情感數據。"
     )
 
+    display_drilldown(selected_board, min_time, max_time, mode)
+
+    if push_hourly_data is not None and not push_hourly_data.empty:
+        st.subheader("💬 推文每小時情感分數")
+        st.dataframe(push_hourly_data.reset_index().rename(columns={'index': '時間'}), use_container_width=True, height=300)
+
     if st.button("顯示已抓取的原始文章資料"):
         st.dataframe(articles_df, use_container_width=True, height=400)
         st.info(f"目前已抓取並累積 {len(articles_df)} 篇文章（含本次新抓取）")
 
+def display_drilldown(selected_board, min_time, max_time, mode='exist', db_path='ptt_cache.db'):
+    """進階查詢：在 SQLite 端依時間、作者、標題關鍵字篩選並聚合，不需載入整個看板。"""
+    with st.expander("🔍 進階查詢（時間區間 / 作者 / 關鍵字）"):
+        if min_time != max_time:
+            time_range = st.slider(
+                "時間區間",
+                min_value=min_time,
+                max_value=max_time + datetime.timedelta(hours=1),
+                value=(min_time, max_time + datetime.timedelta(hours=1)),
+                step=datetime.timedelta(hours=1),
+                format="YYYY/MM/DD HH:00",
+                key=f"drilldown_range_{mode}"
+            )
+        else:
+            time_range = (min_time, max_time + datetime.timedelta(hours=1))
+        col1, col2, col3, col4 = st.columns(4)
+        emotion = col1.selectbox(
+            "情感", EMOTIONS_NAMES,
+            format_func=lambda emo: f"{EMOTION_NAMES_ZH.get(emo, emo)} {EMOTION_EMOJIS.get(emo, '')}",
+            key=f"drilldown_emotion_{mode}"
+        )
+        author = col2.text_input("作者", key=f"drilldown_author_{mode}").strip() or None
+        title_keyword = col3.text_input("標題關鍵字", key=f"drilldown_keyword_{mode}").strip() or None
+        text_keyword = col4.text_input("全文關鍵字（標題與內文）", key=f"drilldown_fulltext_{mode}").strip() or None
+
+        try:
+            with get_database(db_path, pool_size=DB_POOL_SIZE).connection() as conn:
+                show_drilldown_results(conn, selected_board, emotion, time_range, author, title_keyword, text_keyword)
+        except Exception as e:
+            st.warning(f"查詢失敗：{str(e)}")
+
+def show_drilldown_results(conn, selected_board, emotion, time_range, author, title_keyword, text_keyword):
+    """依篩選條件在資料庫端查詢並顯示趨勢、作者排行與文章列表。"""
+    if text_keyword:
+        # 全文關鍵字走全文索引，不掃描內文
+        hourly = keyword_emotion_trend(conn, selected_board, text_keyword, start=time_range[0], end=time_range[1])
+        if hourly.empty:
+            st.info("沒有提及此關鍵字的文章。")
+            return
+        st.line_chart(hourly[emotion])
+        matches = search_articles(conn, selected_board, text_keyword, start=time_range[0], end=time_range[1])
+        st.dataframe(matches[['timestamp', 'title', 'author', emotion]], use_container_width=True, height=300)
+        st.caption(f"共 {int(hourly['article_count'].sum())} 篇文章提及「{text_keyword}」，列出最新 {len(matches)} 篇。")
+        return
+
+    filters = dict(start=time_range[0], end=time_range[1], author=author, title_keyword=title_keyword)
+    hourly = aggregate_emotions(conn, selected_board, group_by='hour', **filters)
+    if hourly.empty:
+        st.info("沒有符合條件的文章。")
+        return
+    st.line_chart(hourly[emotion])
+
+    st.markdown(f"**{EMOTION_NAMES_ZH.get(emotion, emotion)}分數最高的作者**")
+    st.dataframe(
+        aggregate_emotions(conn, selected_board, group_by='author', order_by=emotion, limit=10, **filters),
+        use_container_width=True
+    )
+
+    articles, next_cursor = query_articles(
+        conn, selected_board, columns=['timestamp', 'title', 'author', emotion], page_size=50, **filters
+    )
+    st.dataframe(articles.drop(columns=['id']), use_container_width=True, height=300)
+    if next_cursor is not None:
+        st.caption("僅顯示前 50 篇符合條件的文章。")
+
 # 從 sentiment_analyzer 導入這些額外的映射，用於顯示
 from sentiment_analyzer import emotion_names_zh as EMOTION_NAMES_ZH
 from sentiment_analyzer import emotion_emojis as EMOTION_EMOJIS
 
 # --- SQLite 快取輔助函數 ---
+# 讀取從連線池借出連線，可與寫入同時進行；寫入一律交給單一寫入執行緒依序執行。
+def _write_board(conn, board, df):
+    ensure_board_schema(conn, board)
+    lexicon = get_active_lexicon()
+    upsert_articles(conn, board, df, lexicon)
+    article_ids = lookup_article_ids(conn, board, df).dropna().astype(int).tolist()
+    return maintain_board(
+        conn, board, lexicon if get_sentiment_model(board).name == 'lexicon' else None, article_ids=article_ids
+    )
+
 def save_board_to_sqlite(board, df, db_path='ptt_cache.db'):
-    conn = sqlite3.connect(db_path)
-    df.to_sql(f'ptt_{board}', conn, if_exists='replace', index=False)
-    conn.close()
+    """
+    以 upsert 寫入文章，再執行看板維護（見 maintenance.maintain_board）：套用保留政策壓縮過期資料、
+    使用詞典後端的看板同步到目前生效的詞典版本（只重新計分受詞典變更影響的文章）、更新突增偵測。
+
+    返回:
+        maintain_board 的結果：{'retention': ..., 'rescored': 重新計分的文章數, 'alerts': 新產生的警示}
+    """
+    return get_database(db_path, pool_size=DB_POOL_SIZE).write(_write_board, board, df)
 
 def load_board_from_sqlite(board, db_path='ptt_cache.db'):
-    conn = None
     try:
-        conn = sqlite3.connect(db_path)
-        # 檢查表格是否存在
-        cursor = conn.cursor()
-        cursor.execute(f"SELECT name FROM sqlite_master WHERE type='table' AND name='ptt_{board}'")
-        if cursor.fetchone() is None:
-            # 表格不存在，回傳空 DataFrame
-            return pd.DataFrame()
-        
-        # 只載入近七天
-        seven_days_ago = (datetime.datetime.now() - datetime.timedelta(days=7)).strftime('%Y-%m-%d')
-        query = f"SELECT * FROM ptt_{board} WHERE timestamp >= '{seven_days_ago}'"
-        df = pd.read_sql(query, conn, parse_dates=['timestamp'])
-        return df
+        with get_database(db_path, pool_size=DB_POOL_SIZE).connection() as conn:
+            # 檢查表格是否存在
+            cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (f'ptt_{board}',))
+            if cursor.fetchone() is None:
+                # 表格不存在，回傳空 DataFrame
+                return pd.DataFrame()
+
+            # 只載入近七天
+            seven_days_ago = (datetime.datetime.now() - datetime.timedelta(days=7)).strftime('%Y-%m-%d')
+            columns = ', '.join(ARTICLE_COLUMNS)
+            query = f"SELECT {columns} FROM {board_table(board)} WHERE timestamp >= ?"
+            df = pd.read_sql(query, conn, params=(seven_days_ago,), parse_dates=['timestamp'])
+            df['is_repost'] = df['is_repost'].astype(bool)
+            return df
     except Exception as e:
         # 任何錯誤都回傳空 DataFrame
         return pd.DataFrame()
-    finally:
-        if conn:
-            conn.close()
+
+def load_repost_history_from_sqlite(board, df, db_path='ptt_cache.db'):
+    """讀取可能被 df 的文章轉貼的既有文章，讓轉貼偵測涵蓋先前抓取的文章。"""
+    try:
+        with get_database(db_path, pool_size=DB_POOL_SIZE).connection() as conn:
+            return load_repost_history(conn, board, df)
+    except Exception as e:
+        # 轉貼偵測退回只比對本次抓取的文章
+        st.warning(f"讀取既有文章失敗，本次轉貼偵測只比對新抓取的文章：{str(e)}")
+        return pd.DataFrame()
+
+def _write_pushes(conn, board, articles_df, pushes_df):
+    ensure_board_schema(conn, board)
+    return store_article_pushes(conn, board, articles_df, pushes_df)
+
+def save_pushes_to_sqlite(board, articles_df, pushes_df, db_path='ptt_cache.db'):
+    """
+    將推文與其情感分數寫入精簡的推文表（每則推文一列，以文章 id 參照所屬文章）。
+    本次抓到的文章的舊推文會被取代，重新抓取同一篇文章不會產生重複推文。
+    """
+    return get_database(db_path, pool_size=DB_POOL_SIZE).write(_write_pushes, board, articles_df, pushes_df)
+
+def load_pushes_from_sqlite(board, db_path='ptt_cache.db'):
+    try:
+        with get_database(db_path, pool_size=DB_POOL_SIZE).connection() as conn:
+            cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (f'ptt_{board}_pushes',))
+            if cursor.fetchone() is None:
+                return pd.DataFrame()
+
+            # 只載入近七天，且聚合只需要時間與情感欄位
+            seven_days_ago = (datetime.datetime.now() - datetime.timedelta(days=7)).strftime('%Y-%m-%d')
+            columns = ', '.join(['timestamp'] + EMOTIONS_NAMES)
+            query = f"SELECT {columns} FROM {board_table(board, '_pushes')} WHERE timestamp >= ?"
+            return pd.read_sql(query, conn, params=(seven_days_ago,), parse_dates=['timestamp'])
+    except Exception:
+        return pd.DataFrame()
+
+def load_alerts_from_sqlite(board, since=None, db_path='ptt_cache.db'):
+    try:
+        with get_database(db_path, pool_size=DB_POOL_SIZE).connection() as conn:
+            return load_alerts(conn, board, since=since)
+    except Exception:
+        return pd.DataFrame()
 
 # --- CSV 備用數據讀取函數 ---
 def load_csv_backup(board, info_container=None):
@@ -241,6 +386,8 @@ with st.sidebar:
         st.session_state['articles_df_dict'] = {}
     if 'hourly_data_dict' not in st.session_state:
         st.session_state['hourly_data_dict'] = {}
+    if 'push_hourly_data_dict' not in st.session_state:
+        st.session_state['push_hourly_data_dict'] = {}
     
     # 移除自動載入，只在按下按鈕時才載入資料
 
@@ -277,7 +424,7 @@ if st.session_state.get('trigger_fetch', False):
     if selected_board not in st.session_state['articles_df_dict']:
         st.session_state['articles_df_dict'][selected_board] = load_board_from_sqlite(selected_board)
 
-    sentiment_model_placeholder = get_sentiment_model()
+    sentiment_model = get_sentiment_model(selected_board)
 
     # 取得目前 cache 最新文章時間
     last_time = None
@@ -287,9 +434,11 @@ if st.session_state.get('trigger_fetch', False):
     
     crawler_info_container.info(f"開始呼叫爬蟲函數：get_ptt_articles_from_db({st.session_state['board_for_fetch']}, {last_time})")
     
+    pushes = []
     articles_df = get_ptt_articles_from_db(
         board=st.session_state['board_for_fetch'],
-        last_time=last_time
+        last_time=last_time,
+        push_sink=pushes
     )
     
     result_info_container.info(f"爬蟲函數執行完成，回傳 DataFrame 大小：{len(articles_df)} 行")
@@ -313,11 +462,33 @@ if st.session_state.get('trigger_fetch', False):
         analysis_info_container = st.empty()
         analysis_info_container.info("開始情感分析...")
         
-        articles_df = analyze_sentiment_batch(articles_df, sentiment_model_placeholder)
+        articles_df = analyze_sentiment_batch(
+            articles_df, sentiment_model, history=load_repost_history_from_sqlite(selected_board, articles_df)
+        )
+        fetched_articles = articles_df  # 保留 url 欄位，用於將推文對應到文章 id
         hourly_data = aggregate_emotions_by_hour(articles_df)
         st.session_state['hourly_data_dict'][selected_board] = hourly_data
         st.session_state['articles_df_dict'][selected_board] = articles_df
-        save_board_to_sqlite(selected_board, articles_df)  # 寫入 SQLite
+        maintenance = save_board_to_sqlite(selected_board, articles_df)  # 寫入 SQLite 並執行看板維護
+        rescored = maintenance['rescored']
+        if rescored > 0:
+            # 詞典已更新：重新載入受影響文章的新分數
+            st.info(f"📖 詞典已更新，重新計分 {rescored} 篇受影響的文章。")
+            articles_df = load_board_from_sqlite(selected_board)
+            hourly_data = aggregate_emotions_by_hour(articles_df)
+            st.session_state['hourly_data_dict'][selected_board] = hourly_data
+            st.session_state['articles_df_dict'][selected_board] = articles_df
+
+        new_alerts = maintenance['alerts']
+        if new_alerts:
+            st.warning(f"🚨 偵測到 {len(new_alerts)} 個新的情感突增時段。")
+
+        # 推文：逐則計分後取代本次抓到的文章的推文，再與歷史推文一起每小時聚合
+        if pushes:
+            analysis_info_container.info(f"開始推文情感分析（{len(pushes)} 則）...")
+        save_pushes_to_sqlite(selected_board, fetched_articles, analyze_push_batch(pd.DataFrame(pushes)))
+        push_hourly_data = aggregate_emotions_by_hour(load_pushes_from_sqlite(selected_board))
+        st.session_state['push_hourly_data_dict'][selected_board] = push_hourly_data
         
         # 清空所有 info 訊息
         fetch_info_container.empty()
@@ -327,7 +498,7 @@ if st.session_state.get('trigger_fetch', False):
         analysis_info_container.empty()
         
         st.success("✅ 文章抓取與情感分析完成！")
-        display_analysis_results(selected_board, hourly_data, articles_df,'analyze')
+        display_analysis_results(selected_board, hourly_data, articles_df,'analyze', push_hourly_data)
     else:
         st.warning("⚠️ 沒有找到符合條件的文章，請嘗試其他看板或時間範圍。")
         st.session_state['hourly_data_dict'][selected_board] = pd.DataFrame()
@@ -344,7 +515,8 @@ else:
     if 'hourly_data_dict' in st.session_state and selected_board in st.session_state['hourly_data_dict'] and not st.session_state['hourly_data_dict'][selected_board].empty:
         hourly_data = st.session_state['hourly_data_dict'][selected_board]
         articles_df = st.session_state['articles_df_dict'][selected_board]
-        display_analysis_results(selected_board, hourly_data, articles_df, 'exist')
+        push_hourly_data = st.session_state['push_hourly_data_dict'].get(selected_board)
+        display_analysis_results(selected_board, hourly_data, articles_df, 'exist', push_hourly_data)
 
 st.markdown("---")
 st.caption("數據來源：PTT。情感分析結果來自詞典與規則。")
\ No newline at end of file
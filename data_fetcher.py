@@ -5,25 +5,67 @@ import pandas as pd
 import datetime
 import requests
 from bs4 import BeautifulSoup
+import re
 import time
 import http.cookiejar
 
 # 這裡應該放置你的 PTT 爬蟲和資料庫讀取邏輯
 # 為了範例，我們將使用模擬數據
 
-def get_ptt_articles_from_db(board: str, last_time=None) -> pd.DataFrame:
+# 推文標籤：推 / 噓 / →（箭頭），以小整數儲存以節省空間
+PUSH_TAG_CODES = {'推': 1, '噓': -1, '→': 0}
+
+def parse_push_comments(main_content, post_time: datetime.datetime) -> list:
     """
-    只抓比 last_time 新的文章，並與 cache 合併去重。
+    從文章內頁的 #main-content 節點擷取所有推文。
+
+    參數:
+        main_content: BeautifulSoup 的 #main-content 節點
+        post_time: 文章發文時間，用來補上推文時間缺少的年份
+
+    返回:
+        推文字典列表，包含 tag、user、text、timestamp
     """
-    st.write(f"🔎 正在爬取 PTT {board} 看板過去七天的文章...")
-    base_url = "https://www.ptt.cc"
-    url = f"https://www.ptt.cc/bbs/{board}/index.html"
-    articles = []
-    progress_msg = st.empty()
-    info_msg = st.empty()
-    warning_msg = st.empty()
-    error_msg = st.empty()
-    
+    pushes = []
+    for push in main_content.select('.push'):
+        tag_el = push.select_one('.push-tag')
+        user_el = push.select_one('.push-userid')
+        text_el = push.select_one('.push-content')
+        time_el = push.select_one('.push-ipdatetime')
+        if not (tag_el and user_el and text_el):
+            continue
+
+        tag = tag_el.text.strip()
+        text = text_el.text.strip()
+        if text.startswith(':'):
+            text = text[1:].strip()
+
+        # 推文時間格式為「[IP] MM/DD HH:MM」，沒有年份；跨年時推文月份會小於發文月份
+        push_time = None
+        if time_el:
+            parts = time_el.text.split()
+            if len(parts) >= 2:
+                try:
+                    push_time = datetime.datetime.strptime(
+                        f"{post_time.year}/{parts[-2]} {parts[-1]}", '%Y/%m/%d %H:%M'
+                    )
+                    if push_time < post_time - datetime.timedelta(days=1):
+                        push_time = push_time.replace(year=post_time.year + 1)
+                except ValueError:
+                    push_time = None
+
+        pushes.append({
+            'timestamp': push_time or post_time,
+            'tag': PUSH_TAG_CODES.get(tag, 0),
+            'user': user_el.text.strip(),
+            'text': text,
+        })
+    return pushes
+
+BASE_URL = "https://www.ptt.cc"
+
+def create_session() -> requests.Session:
+    """建立帶有瀏覽器標頭與 over18 cookie 的連線。"""
     # 更真實的瀏覽器標頭
     session = requests.Session()
     session.headers.update({
@@ -46,6 +88,114 @@ def get_ptt_articles_from_db(board: str, last_time=None) -> pd.DataFrame:
     session.cookies.set('over18', '1', domain='www.ptt.cc', path='/')
     session.cookies.set('_ga', 'GA1.1.1234567890.1234567890', domain='.ptt.cc', path='/')
     session.cookies.set('_ga_1234567890', 'GS1.1.1234567890.1.1.1234567890.0.0.0', domain='.ptt.cc', path='/')
+    return session
+
+def parse_post_time(time_str: str):
+    """解析文章內頁的發文時間；無法解析時回傳 None。"""
+    for fmt in ('%a %b %d %H:%M:%S %Y', '%Y/%m/%d %H:%M:%S'):
+        try:
+            return datetime.datetime.strptime(time_str, fmt)
+        except ValueError:
+            continue
+    return None
+
+def extract_article_body(main_content, post_time: datetime.datetime, article_url: str, board: str) -> tuple:
+    """
+    從 #main-content 節點取出內文（去除推文與簽名檔）與推文。
+
+    返回:
+        (內文, 推文字典列表)
+    """
+    content_copy = BeautifulSoup(str(main_content), 'html.parser').select_one('#main-content')
+    pushes = parse_push_comments(content_copy, post_time)
+    for push in pushes:
+        push['article_url'] = article_url
+        push['board'] = board
+    for push in content_copy.select('.push'):
+        push.decompose()
+    content = content_copy.text
+    signature_pos = content.find('--')
+    if signature_pos > 0:
+        content = content[:signature_pos].strip()
+    return content, pushes
+
+def parse_index_page(html: str) -> tuple:
+    """
+    解析看板列表頁。
+
+    返回:
+        (文章列表 [{'url', 'title', 'author'}]，公告與已刪除文章除外；上頁網址或 None)
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    articles = []
+    for item in soup.select('.r-ent'):
+        title_element = item.select_one('.title a')
+        if not title_element or '[公告]' in title_element.text:
+            continue
+        author_element = item.select_one('.meta .author')
+        articles.append({
+            'url': BASE_URL + title_element['href'],
+            'title': title_element.text.strip(),
+            'author': author_element.text.strip() if author_element else "未知",
+        })
+    prev_page = None
+    for link in soup.select('.btn-group-paging a'):
+        if '上頁' in link.text and link.has_attr('href'):
+            prev_page = BASE_URL + link['href']
+            break
+    return articles, prev_page
+
+def index_page_url(board: str, page: int = None) -> str:
+    """看板列表頁網址；page 為 None 時是最新一頁。"""
+    return f"{BASE_URL}/bbs/{board}/index{'' if page is None else page}.html"
+
+def latest_index_page(session: requests.Session, board: str) -> int:
+    """最新列表頁的頁碼（上頁頁碼 + 1）。"""
+    res = session.get(index_page_url(board), timeout=15)
+    res.raise_for_status()
+    _, prev_page = parse_index_page(res.text)
+    match = re.search(r'index(\d+)\.html', prev_page or '')
+    if match is None:
+        raise ValueError(f"無法取得看板 {board} 的頁碼")
+    return int(match.group(1)) + 1
+
+def fetch_article(session: requests.Session, board: str, url: str, title: str, author: str) -> tuple:
+    """
+    抓取並解析一篇文章。
+
+    返回:
+        (文章字典, 推文字典列表)；文章已刪除或無法解析發文時間時回傳 (None, [])
+    """
+    res = session.get(url, timeout=15)
+    if res.status_code == 404:
+        return None, []
+    res.raise_for_status()
+    soup = BeautifulSoup(res.text, 'html.parser')
+    meta_elements = soup.select('.article-meta-value')
+    post_time = parse_post_time(meta_elements[3].text.strip()) if len(meta_elements) >= 4 else None
+    main_content = soup.select_one('#main-content')
+    if post_time is None or main_content is None:
+        return None, []
+    content, pushes = extract_article_body(main_content, post_time, url, board)
+    article = {'timestamp': post_time, 'content': content, 'title': title, 'author': author, 'board': board, 'url': url}
+    return article, pushes
+
+def get_ptt_articles_from_db(board: str, last_time=None, push_sink: list = None) -> pd.DataFrame:
+    """
+    只抓比 last_time 新的文章，並與 cache 合併去重。
+    若提供 push_sink，會將每篇文章的推文（含 article_url、board）附加到該列表，
+    再以文章的 url 欄位對應到文章 id（見 storage.resolve_push_article_ids）。
+    """
+    st.write(f"🔎 正在爬取 PTT {board} 看板過去七天的文章...")
+    base_url = BASE_URL
+    url = index_page_url(board)
+    articles = []
+    progress_msg = st.empty()
+    info_msg = st.empty()
+    warning_msg = st.empty()
+    error_msg = st.empty()
+    
+    session = create_session()
     
     days_to_scrape = 2
     today = datetime.date.today()
@@ -206,16 +356,11 @@ def get_ptt_articles_from_db(board: str, last_time=None) -> pd.DataFrame:
             if len(meta_elements) >= 4:
                 time_str = meta_elements[3].text.strip()
                 info_msg.info(f"時間字串：{time_str}")
-                try:
-                    post_time = datetime.datetime.strptime(time_str, '%a %b %d %H:%M:%S %Y')
-                    info_msg.info(f"解析時間成功：{post_time}")
-                except:
-                    try:
-                        post_time = datetime.datetime.strptime(time_str, '%Y/%m/%d %H:%M:%S')
-                        info_msg.info(f"解析時間成功（第二種格式）：{post_time}")
-                    except:
-                        warning_msg.warning(f"無法解析時間格式：{time_str}")
-                        continue
+                post_time = parse_post_time(time_str)
+                if post_time is None:
+                    warning_msg.warning(f"無法解析時間格式：{time_str}")
+                    continue
+                info_msg.info(f"解析時間成功：{post_time}")
             else:
                 info_msg.info("文章內頁沒有足夠的 meta 元素")
                 continue
@@ -239,14 +384,10 @@ def get_ptt_articles_from_db(board: str, last_time=None) -> pd.DataFrame:
             main_content = art_soup.select_one('#main-content')
             content = ""
             if main_content:
-                content_copy = BeautifulSoup(str(main_content), 'html.parser').select_one('#main-content')
-                for push in content_copy.select('.push'):
-                    push.decompose()
-                content_text = content_copy.text
-                signature_pos = content_text.find('--')
-                if signature_pos > 0:
-                    content_text = content_text[:signature_pos].strip()
-                content = content_text
+                content, article_pushes = extract_article_body(main_content, post_time, article_url, board)
+                if push_sink is not None:
+                    push_sink.extend(article_pushes)
+                    info_msg.info(f"推文數：{len(article_pushes)}")
                 info_msg.info(f"內文長度：{len(content)} 字元")
             else:
                 info_msg.info("無法找到文章內文")
@@ -256,7 +397,8 @@ def get_ptt_articles_from_db(board: str, last_time=None) -> pd.DataFrame:
                 'content': content,
                 'title': title,
                 'author': author,
-                'board': board
+                'board': board,
+                'url': article_url
             })
             current_count += 1
             progress_msg.info(f"爬取 {current_count} 篇：{title}")
@@ -0,0 +1,143 @@
+# db.py
+
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+
+class SQLiteDatabase:
+    """
+    執行緒安全的 SQLite 存取層。
+
+    - 讀取：連線池中的多個連線（WAL 模式下讀取不會被寫入阻擋），用 connection() 借出
+    - 寫入：所有寫入都排進佇列，由單一寫入執行緒以專屬連線依序執行，
+      避免多個寫入者互相等待 SQLite 的資料庫鎖
+    - 每個連線都保留 prepared statement 快取，參數化查詢重複執行時不需重新編譯
+
+    寫入工作是一個接收連線的函數，例如 db.write(upsert_articles, board, df)，
+    因此 storage / search / lexicon 等模組的函數可以直接交給寫入執行緒執行。
+
+    storage、search、lexicon 等模組使用 SQLite 專屬語法（FTS5、PRAGMA、UPSERT），
+    目前只支援 SQLite；PostgreSQL 等其他資料庫不在此存取層的範圍內。
+    """
+
+    def __init__(self, path: str = 'ptt_cache.db', pool_size: int = 4, busy_timeout_ms: int = 5000,
+                 cached_statements: int = 256, pool_timeout: float = 30.0):
+        self.path = path
+        self.pool_timeout = pool_timeout
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cached_statements = cached_statements
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._writes = queue.Queue()
+        self._closed = False
+
+        self._writer_conn = self._connect()
+        from storage import enable_incremental_vacuum
+        enable_incremental_vacuum(self._writer_conn)
+        self._writer_conn.execute("PRAGMA journal_mode=WAL")
+        for _ in range(pool_size):
+            self._pool.put(self._connect())
+
+        self._writer = threading.Thread(target=self._write_loop, name=f"sqlite-writer:{path}", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        return conn
+
+    # --- 讀取 ---
+
+    @contextmanager
+    def connection(self, timeout: float = None):
+        """
+        從連線池借出一個讀取用連線；離開時歸還，未提交的交易會被回復。
+
+        參數:
+            timeout: 等待可用連線的秒數，預設為 pool_timeout
+
+        連線池在時限內都沒有空出連線時拋出 TimeoutError（例如連線借出後未歸還）。
+        """
+        if self._closed:
+            raise RuntimeError("資料庫已關閉")
+        timeout = self.pool_timeout if timeout is None else timeout
+        try:
+            conn = self._pool.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"等待讀取連線逾時（{timeout} 秒，連線池大小 {self._pool.maxsize}）") from None
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._pool.put(conn)
+
+    # --- 寫入 ---
+
+    def _write_loop(self):
+        while True:
+            job = self._writes.get()
+            if job is None:
+                break
+            future, fn, args, kwargs = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(self._writer_conn, *args, **kwargs)
+                if self._writer_conn.in_transaction:
+                    self._writer_conn.commit()
+                future.set_result(result)
+            except BaseException as e:
+                if self._writer_conn.in_transaction:
+                    self._writer_conn.rollback()
+                future.set_exception(e)
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """將寫入工作 fn(conn, *args, **kwargs) 排入寫入佇列，回傳 Future。"""
+        if self._closed:
+            raise RuntimeError("資料庫已關閉")
+        future = Future()
+        self._writes.put((future, fn, args, kwargs))
+        return future
+
+    def write(self, fn, *args, **kwargs):
+        """同 submit()，但等待寫入完成並回傳結果（或拋出寫入時的例外）。"""
+        return self.submit(fn, *args, **kwargs).result()
+
+    def executemany(self, sql: str, rows) -> int:
+        """以單一交易批次執行參數化寫入，回傳影響列數。"""
+        rows = list(rows)
+        return self.write(lambda conn: conn.executemany(sql, rows).rowcount)
+
+    def close(self):
+        """等待佇列中的寫入完成後關閉所有連線。"""
+        if self._closed:
+            return
+        self._closed = True
+        self._writes.put(None)
+        self._writer.join()
+        self._writer_conn.close()
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+def get_database(path: str = 'ptt_cache.db', pool_size: int = 4) -> SQLiteDatabase:
+    """取得行程內共用的資料庫存取層；相同路徑只建立一次。"""
+    with _databases_lock:
+        db = _databases.get(path)
+        if db is None:
+            db = SQLiteDatabase(path, pool_size=pool_size)
+            _databases[path] = db
+        return db
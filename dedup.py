@@ -0,0 +1,170 @@
+# dedup.py
+
+import re
+import zlib
+import datetime
+from collections import deque, defaultdict
+
+import numpy as np
+
+# --- 引文剝除 ---
+# PTT 回文會以「※ 引述《作者 (暱稱)》之銘言：」開頭，並以「: 」前綴逐行引用原文
+QUOTE_HEADER_PATTERN = re.compile(r'^\s*※\s*引述.*$')
+QUOTE_LINE_PATTERN = re.compile(r'^\s*[:：](\s|$)')
+
+
+def strip_quoted_text(text: str) -> str:
+    """
+    移除文章中的引文區塊，只保留作者本次新寫的內容。
+
+    參數:
+        text: 文章內文
+
+    返回:
+        去除「※ 引述」標頭與「: 」引文行後的文本
+    """
+    if not isinstance(text, str) or not text:
+        return ""
+
+    kept_lines = []
+    for line in text.split('\n'):
+        if QUOTE_HEADER_PATTERN.match(line) or QUOTE_LINE_PATTERN.match(line):
+            continue
+        kept_lines.append(line)
+    return '\n'.join(kept_lines).strip()
+
+
+# --- MinHash 指紋 ---
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def _shingles(text: str, k: int) -> set:
+    """以字元 k-gram 切片；中文沒有空白斷詞，字元切片比詞切片穩定。"""
+    normalized = _WHITESPACE_PATTERN.sub('', text)
+    if len(normalized) <= k:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + k] for i in range(len(normalized) - k + 1)}
+
+
+class MinHasher:
+    """
+    以固定亂數種子產生 num_perm 組雜湊函數，計算文本的 MinHash 簽章。
+    使用 crc32 而非內建 hash()，確保跨行程的簽章一致。
+    """
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 3, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, _MAX_HASH, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, _MAX_HASH, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str):
+        """回傳長度為 num_perm 的 MinHash 簽章；文本過短時回傳 None。"""
+        shingles = _shingles(text, self.shingle_size)
+        if not shingles:
+            return None
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode('utf-8')) for s in shingles),
+            dtype=np.uint64, count=len(shingles)
+        )
+        # (a * x + b) mod p，取每組雜湊函數的最小值
+        permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME
+        return (permuted & _MAX_HASH).min(axis=0)
+
+
+def estimate_similarity(sig_a, sig_b) -> float:
+    """以兩個 MinHash 簽章估計 Jaccard 相似度。"""
+    return float(np.mean(sig_a == sig_b))
+
+
+class FingerprintIndex:
+    """
+    MinHash + LSH 分段索引，用於在時間窗內偵測轉貼與近似重複文章。
+
+    簽章切成 bands 段，每段雜湊進一個桶；只有落在同一桶的文章才需要比對，
+    因此查詢成本與索引大小無關（次線性）。超出時間窗的文章會被淘汰。
+    """
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 64, bands: int = 16,
+                 window: datetime.timedelta = datetime.timedelta(days=2)):
+        if num_perm % bands != 0:
+            raise ValueError("num_perm 必須能被 bands 整除")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.window = window
+        self.hasher = MinHasher(num_perm=num_perm)
+        self._buckets = [defaultdict(set) for _ in range(bands)]
+        self._signatures = {}
+        self._timeline = deque()  # (timestamp, key)，依加入順序排列
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def _band_keys(self, signature):
+        for band in range(self.bands):
+            start = band * self.rows
+            yield band, signature[start:start + self.rows].tobytes()
+
+    def _evict(self, now):
+        if now is None or self.window is None:
+            return
+        cutoff = now - self.window
+        while self._timeline and self._timeline[0][0] < cutoff:
+            _, key = self._timeline.popleft()
+            signature = self._signatures.pop(key, None)
+            if signature is None:
+                continue
+            for band, band_key in self._band_keys(signature):
+                bucket = self._buckets[band].get(band_key)
+                if bucket is not None:
+                    bucket.discard(key)
+                    if not bucket:
+                        del self._buckets[band][band_key]
+
+    def query(self, signature):
+        """回傳相似度達門檻、最相似的已索引文章 key；沒有則回傳 None。"""
+        if signature is None:
+            return None
+        candidates = set()
+        for band, band_key in self._band_keys(signature):
+            candidates.update(self._buckets[band].get(band_key, ()))
+
+        best_key, best_score = None, self.threshold
+        for key in candidates:
+            score = estimate_similarity(signature, self._signatures[key])
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+    def add(self, key, signature, timestamp=None):
+        """將文章簽章加入索引。"""
+        if signature is None:
+            return
+        self._signatures[key] = signature
+        for band, band_key in self._band_keys(signature):
+            self._buckets[band][band_key].add(key)
+        if timestamp is not None:
+            self._timeline.append((timestamp, key))
+
+    def find_or_add(self, key, text: str, timestamp=None):
+        """
+        檢查文本是否為時間窗內既有文章的轉貼；若不是則加入索引。
+
+        參數:
+            key: 文章識別值
+            text: 已剝除引文的文本
+            timestamp: 發文時間，用於淘汰過期的索引項目
+
+        返回:
+            重複來源文章的 key；若為新文章則回傳 None
+        """
+        self._evict(timestamp)
+        signature = self.hasher.signature(text)
+        duplicate_of = self.query(signature)
+        if duplicate_of is None:
+            self.add(key, signature, timestamp)
+        return duplicate_of
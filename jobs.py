@@ -0,0 +1,185 @@
+# jobs.py
+
+import json
+import time
+import datetime
+import sqlite3
+
+from storage import TIMESTAMP_FORMAT, board_table
+
+# 工作種類：
+# - 'pages'：{"first": 起始頁碼, "last": 結束頁碼}，解析列表頁後展開為文章批次工作
+# - 'articles'：{"articles": [[網址, 標題, 作者], ...]}，抓取、解析並計分這批文章
+JOB_KINDS = ('pages', 'articles')
+
+
+class Job:
+    """一個已被工作者認領的工作。"""
+
+    __slots__ = ('id', 'board', 'kind', 'payload', 'attempts')
+
+    def __init__(self, id: int, board: str, kind: str, payload: dict, attempts: int):
+        self.id = id
+        self.board = board
+        self.kind = kind
+        self.payload = payload
+        self.attempts = attempts
+
+    def __repr__(self):
+        return f"Job(id={self.id}, board={self.board!r}, kind={self.kind!r}, attempts={self.attempts})"
+
+
+def ensure_jobs_schema(conn: sqlite3.Connection):
+    """
+    建立工作佇列表。相同 (board, kind, payload) 只會有一列，重複排入不會產生重複工作。
+    lease_expires 與 available_at 為 Unix 時間（秒）。
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_jobs (
+            id INTEGER PRIMARY KEY,
+            board TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL,
+            available_at REAL NOT NULL,
+            lease_owner TEXT,
+            lease_expires REAL,
+            last_error TEXT,
+            created_at TEXT NOT NULL,
+            UNIQUE (board, kind, payload)
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ingest_jobs_status ON ingest_jobs (status, available_at)")
+    conn.commit()
+
+
+def enqueue(conn: sqlite3.Connection, board: str, kind: str, payload: dict, max_attempts: int = 3) -> int:
+    """
+    排入一個工作。同樣的工作若尚在等待或執行中則不變；已完成或已失敗則重新排入。
+
+    返回:
+        新排入（或重新排入）的工作數（0 或 1）
+    """
+    if kind not in JOB_KINDS:
+        raise ValueError(f"不支援的工作種類：{kind}")
+    board_table(board)  # 驗證看板名稱
+    created_at = datetime.datetime.now().strftime(TIMESTAMP_FORMAT)
+    cursor = conn.execute(
+        "INSERT INTO ingest_jobs (board, kind, payload, max_attempts, available_at, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT (board, kind, payload) DO UPDATE SET status = 'pending', attempts = 0, "
+        "max_attempts = excluded.max_attempts, available_at = excluded.available_at, "
+        "lease_owner = NULL, lease_expires = NULL, last_error = NULL "
+        "WHERE ingest_jobs.status IN ('done', 'failed')",
+        (board, kind, json.dumps(payload, ensure_ascii=False, sort_keys=True), max_attempts, time.time(), created_at)
+    )
+    conn.commit()
+    return cursor.rowcount
+
+
+def enqueue_page_ranges(conn: sqlite3.Connection, board: str, first: int, last: int, pages_per_job: int,
+                        max_attempts: int = 3) -> int:
+    """將列表頁 [first, last] 切成每段 pages_per_job 頁的工作排入，回傳排入的工作數。"""
+    queued = 0
+    for start in range(first, last + 1, pages_per_job):
+        payload = {'first': start, 'last': min(start + pages_per_job - 1, last)}
+        queued += enqueue(conn, board, 'pages', payload, max_attempts)
+    return queued
+
+
+def claim(conn: sqlite3.Connection, worker_id: str, lease_seconds: float, boards: list = None) -> Job:
+    """
+    認領一個可執行的工作：等待中且已到可執行時間，或執行中但租約已過期（工作者中斷）。
+
+    選取與更新在同一個 BEGIN IMMEDIATE 交易內完成，多個工作者同時認領時不會取得同一個工作。
+    租約過期且已用完嘗試次數的工作會被標記為失敗。
+
+    返回:
+        Job，沒有可執行的工作時回傳 None
+    """
+    now = time.time()
+    board_filter, params = '', [now, now]
+    if boards:
+        board_filter = f" AND board IN ({', '.join('?' for _ in boards)})"
+        params += list(boards)
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            "UPDATE ingest_jobs SET status = 'failed', lease_owner = NULL, "
+            "last_error = COALESCE(last_error, '租約過期') "
+            "WHERE status = 'running' AND lease_expires < ? AND attempts >= max_attempts",
+            (now,)
+        )
+        row = conn.execute(
+            "SELECT id, board, kind, payload, attempts FROM ingest_jobs "
+            "WHERE ((status = 'pending' AND available_at <= ?) OR (status = 'running' AND lease_expires < ?))"
+            f"{board_filter} ORDER BY available_at, id LIMIT 1",
+            params
+        ).fetchone()
+        if row is None:
+            conn.commit()
+            return None
+        job_id, board, kind, payload, attempts = row
+        conn.execute(
+            "UPDATE ingest_jobs SET status = 'running', attempts = attempts + 1, "
+            "lease_owner = ?, lease_expires = ? WHERE id = ?",
+            (worker_id, now + lease_seconds, job_id)
+        )
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return Job(job_id, board, kind, json.loads(payload), attempts + 1)
+
+
+def heartbeat(conn: sqlite3.Connection, job: Job, worker_id: str, lease_seconds: float) -> bool:
+    """延長租約；回傳 False 表示租約已過期並被其他工作者認領，應放棄此工作。"""
+    cursor = conn.execute(
+        "UPDATE ingest_jobs SET lease_expires = ? WHERE id = ? AND lease_owner = ? AND status = 'running'",
+        (time.time() + lease_seconds, job.id, worker_id)
+    )
+    conn.commit()
+    return cursor.rowcount == 1
+
+
+def complete(conn: sqlite3.Connection, job: Job, worker_id: str) -> bool:
+    cursor = conn.execute(
+        "UPDATE ingest_jobs SET status = 'done', lease_owner = NULL, lease_expires = NULL, last_error = NULL "
+        "WHERE id = ? AND lease_owner = ? AND status = 'running'",
+        (job.id, worker_id)
+    )
+    conn.commit()
+    return cursor.rowcount == 1
+
+
+def fail(conn: sqlite3.Connection, job: Job, worker_id: str, error: str, retry_delay: float) -> str:
+    """
+    記錄失敗。尚有嘗試次數時以指數退避（retry_delay * 2^(attempts-1) 秒）重新排入，否則標記為失敗。
+
+    返回:
+        工作的新狀態（'pending' 或 'failed'）；租約已不屬於此工作者時回傳 None
+    """
+    available_at = time.time() + retry_delay * 2 ** (job.attempts - 1)
+    cursor = conn.execute(
+        "UPDATE ingest_jobs SET status = CASE WHEN attempts < max_attempts THEN 'pending' ELSE 'failed' END, "
+        "available_at = ?, lease_owner = NULL, lease_expires = NULL, last_error = ? "
+        "WHERE id = ? AND lease_owner = ? AND status = 'running'",
+        (available_at, str(error)[:1000], job.id, worker_id)
+    )
+    conn.commit()
+    if cursor.rowcount == 0:
+        return None
+    return conn.execute("SELECT status FROM ingest_jobs WHERE id = ?", (job.id,)).fetchone()[0]
+
+
+def job_counts(conn: sqlite3.Connection) -> dict:
+    """各看板、各狀態的工作數：{(board, status): count}。"""
+    return {
+        (board, status): count
+        for board, status, count in conn.execute(
+            "SELECT board, status, COUNT(*) FROM ingest_jobs GROUP BY board, status ORDER BY board, status"
+        )
+    }
@@ -0,0 +1,322 @@
+# lexicon.py
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+import warnings
+
+from config import EMOTIONS_NAMES
+from dedup import strip_quoted_text
+from storage import board_table
+from search import build_match_query, fts_table
+
+
+class Lexicon:
+    """
+    一個版本的情感詞典、否定詞與程度副詞。
+
+    content_hash 由詞典內容計算，用來判斷兩個詞典是否相同；version 只是顯示用的標籤
+    （詞典檔可自行填寫，未填時等於 content_hash），修改詞彙卻沒有更新 version 時也能偵測到變更。
+    revision 為詞典生效的時間（Unix 秒；詞典檔為其修改時間），多個行程各自熱重載時，
+    用來判斷哪一個詞典較新。
+    """
+
+    def __init__(self, emotion_lexicon: dict, negation_words: list, degree_adverbs: dict, version: str = None,
+                 revision: float = 0.0):
+        self.emotion_lexicon = emotion_lexicon
+        self.negation_words = negation_words
+        self.degree_adverbs = degree_adverbs
+        self.content_hash = hashlib.sha1(self.to_json().encode('utf-8')).hexdigest()[:12]
+        self.version = version or self.content_hash
+        self.revision = revision
+
+    @classmethod
+    def from_dict(cls, data: dict, version: str = None, revision: float = 0.0):
+        return cls(
+            emotion_lexicon=data['emotion_lexicon'],
+            negation_words=data['negation_words'],
+            degree_adverbs=data['degree_adverbs'],
+            version=data.get('version', version),
+            revision=revision,
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            'emotion_lexicon': self.emotion_lexicon,
+            'negation_words': self.negation_words,
+            'degree_adverbs': self.degree_adverbs,
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False, sort_keys=True)
+
+    def term_roles(self) -> dict:
+        """回傳 詞 -> 角色集合（情感類型、'negation' 或 'degree:<level>'），用於比較版本差異。"""
+        roles = {}
+        for emotion_type, words in self.emotion_lexicon.items():
+            for word in words:
+                roles.setdefault(word, set()).add(emotion_type)
+        for word in self.negation_words:
+            roles.setdefault(word, set()).add('negation')
+        for level, adverbs in self.degree_adverbs.items():
+            for word in adverbs:
+                roles.setdefault(word, set()).add(f'degree:{level}')
+        return roles
+
+    def terms(self) -> set:
+        return set(self.term_roles())
+
+
+def builtin_lexicon(revision: float = 0.0) -> Lexicon:
+    """sentiment_analyzer 內建的詞典。"""
+    import sentiment_analyzer
+    return Lexicon(
+        sentiment_analyzer.emotion_lexicon,
+        sentiment_analyzer.negation_words,
+        sentiment_analyzer.degree_adverbs,
+        version='builtin',
+        revision=revision,
+    )
+
+
+def load_lexicon_file(path: str) -> Lexicon:
+    """
+    讀取外部詞典檔（JSON），格式為：
+    {"version": "...", "emotion_lexicon": {...}, "negation_words": [...], "degree_adverbs": {...}}
+    未提供 version 時以內容雜湊作為版本；revision 為檔案的修改時間。
+    """
+    revision = os.path.getmtime(path)
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    unknown = [emo for emo in data.get('emotion_lexicon', {}) if emo not in EMOTIONS_NAMES]
+    if unknown:
+        raise ValueError(f"詞典含有未知的情感類型：{unknown}")
+    return Lexicon.from_dict(data, revision=revision)
+
+
+def save_lexicon_file(path: str, lexicon: Lexicon):
+    """將詞典寫成外部詞典檔；先寫入暫存檔再取代，避免執行中的行程讀到寫了一半的檔案。"""
+    data = dict(lexicon.to_dict(), version=lexicon.version)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+class LexiconStore:
+    """
+    提供目前生效的詞典，並在外部詞典檔變動時熱重載。
+
+    get() 最多每 check_interval 秒檢查一次檔案修改時間；檔案不存在時使用內建詞典，
+    檔案格式錯誤時保留上一個可用版本。
+    """
+
+    def __init__(self, path: str = None, check_interval: float = 5.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lexicon = None
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> Lexicon:
+        now = time.monotonic()
+        if self._lexicon is not None and now - self._checked_at < self.check_interval:
+            return self._lexicon
+
+        with self._lock:
+            self._checked_at = now
+            mtime = None
+            if self.path and os.path.exists(self.path):
+                mtime = os.path.getmtime(self.path)
+            if self._lexicon is not None and mtime == self._mtime:
+                return self._lexicon
+
+            if mtime is None:
+                # 詞典檔不存在（或已被刪除）：內建詞典自此刻起生效
+                self._lexicon = builtin_lexicon(revision=time.time())
+            else:
+                try:
+                    self._lexicon = load_lexicon_file(self.path)
+                except (OSError, ValueError, KeyError) as e:
+                    if self._lexicon is None:
+                        self._lexicon = builtin_lexicon()
+                    warnings.warn(f"詞典檔 {self.path} 載入失敗，沿用版本 {self._lexicon.version}：{e}")
+                    return self._lexicon
+            self._mtime = mtime
+            return self._lexicon
+
+
+def changed_terms(old: Lexicon, new: Lexicon) -> tuple:
+    """
+    比較兩個詞典版本。
+
+    返回:
+        (新增的詞, 移除或角色改變的詞)
+    """
+    old_roles, new_roles = old.term_roles(), new.term_roles()
+    added = set(new_roles) - set(old_roles)
+    modified = {term for term, roles in old_roles.items() if new_roles.get(term) != roles}
+    return added, modified
+
+
+# --- 詞 -> 文章 反向索引 ---
+
+def terms_table(board: str) -> str:
+    return board_table(board, '_lexicon_terms')
+
+
+def ensure_lexicon_schema(conn: sqlite3.Connection, board: str):
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {terms_table(board)} (
+            term TEXT NOT NULL,
+            article_id INTEGER NOT NULL,
+            PRIMARY KEY (term, article_id)
+        ) WITHOUT ROWID
+    """)
+    conn.execute(f'CREATE INDEX IF NOT EXISTS "idx_ptt_{board}_lexicon_terms_article" ON {terms_table(board)} (article_id)')
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS lexicon_state (
+            board TEXT PRIMARY KEY,
+            version TEXT NOT NULL,
+            data TEXT NOT NULL,
+            revision REAL NOT NULL DEFAULT 0
+        )
+    """)
+    if 'revision' not in [row[1] for row in conn.execute("PRAGMA table_info(lexicon_state)")]:
+        conn.execute("ALTER TABLE lexicon_state ADD COLUMN revision REAL NOT NULL DEFAULT 0")
+    conn.commit()
+
+
+def _terms_in_text(text: str, terms) -> list:
+    """子字串比對；結果是斷詞命中的超集合，足以判斷哪些文章可能受影響。"""
+    if not isinstance(text, str) or not text:
+        return []
+    return [term for term in terms if term in text]
+
+
+def index_article_terms(conn: sqlite3.Connection, board: str, ids: list, lexicon: Lexicon,
+                        chunk_size: int = 500):
+    """重建指定文章的 詞 -> 文章 反向索引列。內文已清除的文章不會被索引（無法重新計分）。"""
+    terms = lexicon.terms()
+    ids = list(ids)
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        placeholders = ', '.join('?' for _ in chunk)
+        rows = conn.execute(
+            f"SELECT id, content FROM {board_table(board)} WHERE id IN ({placeholders})", chunk
+        ).fetchall()
+        conn.execute(f"DELETE FROM {terms_table(board)} WHERE article_id IN ({placeholders})", chunk)
+        conn.executemany(
+            f"INSERT OR IGNORE INTO {terms_table(board)} (term, article_id) VALUES (?, ?)",
+            ((term, row_id) for row_id, content in rows for term in _terms_in_text(content, terms))
+        )
+    conn.commit()
+
+
+def remove_article_terms(conn: sqlite3.Connection, board: str, start: str, end: str):
+    """移除 [start, end) 時間範圍內文章的反向索引列；須在刪除或清除內文之前呼叫。"""
+    conn.execute(
+        f"DELETE FROM {terms_table(board)} WHERE article_id IN "
+        f"(SELECT id FROM {board_table(board)} WHERE timestamp >= ? AND timestamp < ?)",
+        (start, end)
+    )
+
+
+def affected_articles(conn: sqlite3.Connection, board: str, added: set, modified: set) -> set:
+    """
+    找出受詞典變更影響的文章 id：
+    移除或改變角色的詞查反向索引；新增的詞不在舊索引裡，改用全文索引查詢。
+    """
+    ids = set()
+    modified = list(modified)
+    for start in range(0, len(modified), 500):
+        chunk = modified[start:start + 500]
+        placeholders = ', '.join('?' for _ in chunk)
+        ids.update(row[0] for row in conn.execute(
+            f"SELECT DISTINCT article_id FROM {terms_table(board)} WHERE term IN ({placeholders})", chunk
+        ))
+
+    for term in added:
+        match = build_match_query(term, columns=('content',))
+        if match:
+            query, params = f"SELECT rowid FROM {fts_table(board)} WHERE {fts_table(board)} MATCH ?", (match,)
+        else:
+            # 單字詞無法使用二元組索引
+            query, params = f"SELECT id FROM {board_table(board)} WHERE instr(content, ?) > 0", (term,)
+        ids.update(row[0] for row in conn.execute(query, params))
+    return ids
+
+
+def rescore_articles(conn: sqlite3.Connection, board: str, ids: list, lexicon: Lexicon,
+                     chunk_size: int = 500) -> int:
+    """以指定詞典重新計算文章分數，並更新其反向索引列。內文已清除的文章會被略過。"""
+    from sentiment_analyzer import analyze_article_texts
+
+    updated = 0
+    ids = list(ids)
+    assignments = ', '.join(f'{emo} = ?' for emo in EMOTIONS_NAMES)
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        placeholders = ', '.join('?' for _ in chunk)
+        rows = conn.execute(
+            f"SELECT id, content FROM {board_table(board)} WHERE id IN ({placeholders}) AND content IS NOT NULL",
+            chunk
+        ).fetchall()
+        if not rows:
+            continue
+        scores = analyze_article_texts(
+            [strip_quoted_text(content) for _, content in rows],
+            lexicon.emotion_lexicon, lexicon.negation_words, lexicon.degree_adverbs
+        )
+        conn.executemany(
+            f"UPDATE {board_table(board)} SET {assignments} WHERE id = ?",
+            ([float(v) for v in score_row] + [row_id] for (row_id, _), score_row in zip(rows, scores))
+        )
+        conn.commit()
+        index_article_terms(conn, board, [row_id for row_id, _ in rows], lexicon)
+        updated += len(rows)
+    return updated
+
+
+def sync_board_lexicon(conn: sqlite3.Connection, board: str, lexicon: Lexicon, article_ids: list = None) -> int:
+    """
+    讓看板的分數與目前詞典一致。
+
+    lexicon_state 記錄看板分數所依據的詞典內容；內容（content_hash）不同時只重新計分受變更影響的文章，
+    不論詞典檔的 version 標籤是否有更新。第一次同步時會為既有文章建立反向索引。
+
+    各行程熱重載詞典的時間不同，看板可能已由其他行程同步到 revision 較新的詞典；
+    此時不會退回 lexicon，而是以看板的詞典重新計分 article_ids（呼叫端剛以 lexicon 計分並寫入的文章）。
+
+    返回:
+        重新計分的文章數
+    """
+    ensure_lexicon_schema(conn, board)
+    row = conn.execute("SELECT version, data, revision FROM lexicon_state WHERE board = ?", (board,)).fetchone()
+    previous = Lexicon.from_dict(json.loads(row[1]), version=row[0], revision=row[2]) if row is not None else None
+    if previous is not None and previous.content_hash == lexicon.content_hash:
+        return 0
+    if previous is not None and previous.revision > lexicon.revision:
+        return rescore_articles(conn, board, sorted(article_ids or []), previous)
+
+    rescored = 0
+    if previous is None:
+        ids = [r[0] for r in conn.execute(f"SELECT id FROM {board_table(board)}")]
+        index_article_terms(conn, board, ids, lexicon)
+    else:
+        added, modified = changed_terms(previous, lexicon)
+        if added or modified:
+            rescored = rescore_articles(conn, board, sorted(affected_articles(conn, board, added, modified)), lexicon)
+
+    conn.execute(
+        "INSERT INTO lexicon_state (board, version, data, revision) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (board) DO UPDATE SET version = excluded.version, data = excluded.data, "
+        "revision = excluded.revision",
+        (board, lexicon.version, lexicon.to_json(), lexicon.revision)
+    )
+    conn.commit()
+    return rescored
@@ -0,0 +1,57 @@
+# maintenance.py
+"""
+看板寫入新資料後的維護步驟：保留政策、詞典同步與突增偵測。
+
+儀表板的抓取流程（app.py）與擷取工作者（worker.py）每次寫入後都呼叫 maintain_board，
+不論資料由哪一方寫入，看板都會套用相同的維護。各步驟都是冪等的，
+多個行程先後對同一個看板執行也不會重複彙總或重複產生警示。
+"""
+
+import sqlite3
+
+from config import (
+    RETENTION_CONTENT_DAYS, RETENTION_SCORE_DAYS, RETENTION_MAX_PARTITIONS, RETENTION_VACUUM_PAGES,
+    ANOMALY_EWMA_ALPHA, ANOMALY_Z_THRESHOLD, ANOMALY_WARMUP_HOURS, ANOMALY_MIN_STD, ANOMALY_MIN_ARTICLES,
+    ANOMALY_RECHECK_HOURS
+)
+from storage import apply_retention
+from lexicon import sync_board_lexicon
+from anomaly import SpikeDetector, update_board_alerts
+
+
+def create_spike_detector() -> SpikeDetector:
+    """依 config 的 ANOMALY_* 設定建立突增偵測器；狀態由 update_board_alerts 從資料庫載入。"""
+    return SpikeDetector(
+        alpha=ANOMALY_EWMA_ALPHA,
+        threshold=ANOMALY_Z_THRESHOLD,
+        warmup=ANOMALY_WARMUP_HOURS,
+        min_std=ANOMALY_MIN_STD,
+        min_articles=ANOMALY_MIN_ARTICLES
+    )
+
+
+def maintain_board(conn: sqlite3.Connection, board: str, lexicon=None, detector: SpikeDetector = None,
+                   article_ids: list = None) -> dict:
+    """
+    依序套用保留政策、同步詞典、以新增的完整小時更新突增偵測。
+
+    參數:
+        lexicon: 看板使用詞典後端時傳入計分所用的詞典以同步分數；其他後端傳入 None
+        detector: 突增偵測器，預設以 create_spike_detector() 建立
+        article_ids: 剛以 lexicon 計分並寫入的文章 id；看板已同步到較新的詞典時會以該詞典重新計分
+
+    返回:
+        {'retention': 保留政策統計, 'rescored': 因詞典變更而重新計分的文章數, 'alerts': 先前沒有的新警示列表}
+    """
+    retention = apply_retention(
+        conn, board,
+        content_days=RETENTION_CONTENT_DAYS,
+        score_days=RETENTION_SCORE_DAYS,
+        max_partitions=RETENTION_MAX_PARTITIONS,
+        vacuum_pages=RETENTION_VACUUM_PAGES
+    )
+    rescored = sync_board_lexicon(conn, board, lexicon, article_ids) if lexicon is not None else 0
+    alerts = update_board_alerts(
+        conn, board, detector or create_spike_detector(), recheck_hours=ANOMALY_RECHECK_HOURS
+    )
+    return {'retention': retention, 'rescored': rescored, 'alerts': alerts}
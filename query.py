@@ -0,0 +1,206 @@
+# query.py
+
+import sqlite3
+
+import pandas as pd
+
+from config import EMOTIONS_NAMES
+from storage import ARTICLE_COLUMNS, TIMESTAMP_FORMAT, board_table
+
+# 可用的分組方式：SQL 分組鍵表達式
+GROUP_BY_EXPRESSIONS = {
+    'hour': "substr(timestamp, 1, 13) || ':00:00'",
+    'day': "substr(timestamp, 1, 10)",
+    'author': "author",
+}
+
+
+def _format_time(value):
+    return pd.to_datetime(value).strftime(TIMESTAMP_FORMAT) if value is not None else None
+
+
+def _escape_like(keyword: str) -> str:
+    return keyword.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _check_columns(columns: list) -> list:
+    """驗證要取出的欄位名稱，避免將任意字串組進 SQL。"""
+    columns = list(columns or ARTICLE_COLUMNS)
+    unknown = [c for c in columns if c not in ARTICLE_COLUMNS + ['id']]
+    if unknown:
+        raise ValueError(f"不支援的欄位：{', '.join(map(str, unknown))}")
+    return columns
+
+
+def build_article_filter(start=None, end=None, author=None, title_keyword=None,
+                         time_column: str = 'timestamp') -> tuple:
+    """
+    組出文章查詢的 WHERE 子句與參數。時間範圍為 [start, end)，走 timestamp 索引；
+    author 可為單一作者或作者列表，走 (author, timestamp) 索引。
+
+    返回:
+        (where 子句, 參數列表)
+    """
+    clauses, params = [], []
+    if start is not None:
+        clauses.append(f"{time_column} >= ?")
+        params.append(_format_time(start))
+    if end is not None:
+        clauses.append(f"{time_column} < ?")
+        params.append(_format_time(end))
+    if author:
+        authors = [author] if isinstance(author, str) else list(author)
+        clauses.append(f"author IN ({', '.join('?' for _ in authors)})")
+        params.extend(authors)
+    if title_keyword:
+        clauses.append("title LIKE ? ESCAPE '\\'")
+        params.append(f"%{_escape_like(title_keyword)}%")
+    return (' AND '.join(clauses) or '1'), params
+
+
+def query_articles(conn: sqlite3.Connection, board: str, start=None, end=None, author=None,
+                   title_keyword=None, columns: list = None, page_size: int = 100,
+                   cursor: tuple = None) -> tuple:
+    """
+    依條件分頁查詢文章，以 (timestamp, id) 做 keyset 分頁，翻頁成本不隨頁數增加。
+
+    參數:
+        conn: SQLite 連線
+        board: 看板名稱
+        start, end: 時間範圍 [start, end)
+        author: 作者或作者列表
+        title_keyword: 標題關鍵字
+        columns: 要取出的欄位，預設為全部欄位；只需要分數時省略 content 可減少讀取量。
+                 id 與 timestamp 為分頁游標所需，一律會取出
+        page_size: 每頁筆數
+        cursor: 上一頁回傳的 next_cursor；None 表示第一頁
+
+    返回:
+        (DataFrame, next_cursor)；沒有下一頁時 next_cursor 為 None
+    """
+    columns = _check_columns(columns)
+    where, params = build_article_filter(start, end, author, title_keyword)
+    if cursor is not None:
+        where += " AND (timestamp, id) > (?, ?)"
+        params.extend(cursor)
+
+    # keyset 游標需要 (timestamp, id)，不論呼叫端要求哪些欄位都一併取出
+    select_columns = ', '.join(['id', 'timestamp'] + [c for c in columns if c not in ('id', 'timestamp')])
+    sql = (
+        f"SELECT {select_columns} FROM {board_table(board)} WHERE {where} "
+        f"ORDER BY timestamp, id LIMIT ?"
+    )
+    df = pd.read_sql(sql, conn, params=params + [page_size + 1])
+
+    next_cursor = None
+    if len(df) > page_size:
+        df = df.iloc[:page_size]
+        last = df.iloc[-1]
+        next_cursor = (last['timestamp'], int(last['id']))
+    if 'timestamp' in df.columns:
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+    return df, next_cursor
+
+
+def iter_articles(conn: sqlite3.Connection, board: str, start=None, end=None, author=None,
+                  title_keyword=None, columns: list = None, chunk_size: int = 1000):
+    """
+    以串流方式逐批產生符合條件的文章 DataFrame，記憶體用量只與 chunk_size 有關。
+    """
+    columns = _check_columns(columns)
+    where, params = build_article_filter(start, end, author, title_keyword)
+    db_cursor = conn.execute(
+        f"SELECT {', '.join(columns)} FROM {board_table(board)} WHERE {where} ORDER BY timestamp, id",
+        params
+    )
+    while True:
+        rows = db_cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        chunk = pd.DataFrame(rows, columns=columns)
+        if 'timestamp' in chunk.columns:
+            chunk['timestamp'] = pd.to_datetime(chunk['timestamp'])
+        yield chunk
+
+
+def aggregate_emotions(conn: sqlite3.Connection, board: str, group_by: str = 'hour', start=None,
+                       end=None, author=None, title_keyword=None, order_by: str = None,
+                       descending: bool = True, min_count: int = 1, limit: int = None,
+                       include_rollups: bool = True) -> pd.DataFrame:
+    """
+    在 SQL 端做分組情感聚合，只回傳聚合結果。
+
+    以小時或日分組且沒有作者、標題條件時，會一併納入保留政策產生的每小時彙總表，
+    因此超過保留期限、原始列已刪除的時段仍可查詢。
+
+    參數:
+        conn: SQLite 連線
+        board: 看板名稱
+        group_by: 'hour'、'day' 或 'author'
+        start, end: 時間範圍 [start, end)
+        author: 作者或作者列表
+        title_keyword: 標題關鍵字
+        order_by: 排序依據的情感名稱或 'article_count'；預設依分組鍵排序
+        descending: 是否遞減排序
+        min_count: 每組最少文章數
+        limit: 最多回傳組數
+        include_rollups: 是否納入每小時彙總表
+
+    返回:
+        以分組鍵為索引，含 article_count 與各情感平均分數的 DataFrame
+    """
+    if group_by not in GROUP_BY_EXPRESSIONS:
+        raise ValueError(f"不支援的分組方式：{group_by}")
+    if order_by is not None and order_by not in EMOTIONS_NAMES + ['article_count']:
+        raise ValueError(f"不支援的排序欄位：{order_by}")
+
+    key = GROUP_BY_EXPRESSIONS[group_by]
+    where, params = build_article_filter(start, end, author, title_keyword)
+    sums = ', '.join(f'SUM({emo}) AS {emo}_sum' for emo in EMOTIONS_NAMES)
+    source = f"SELECT {key} AS group_key, COUNT(*) AS item_count, {sums} FROM {board_table(board)} WHERE {where} GROUP BY 1"
+
+    use_rollups = include_rollups and group_by in ('hour', 'day') and not author and not title_keyword
+    if use_rollups and _rollup_exists(conn, board):
+        rollup_key = 'hour' if group_by == 'hour' else 'substr(hour, 1, 10)'
+        rollup_where, rollup_params = build_article_filter(start, end, time_column='hour')
+        sum_columns = ', '.join(f'SUM({emo}_sum)' for emo in EMOTIONS_NAMES)
+        source += (
+            f" UNION ALL SELECT {rollup_key}, SUM(item_count), {sum_columns} "
+            f"FROM {board_table(board, '_hourly')} WHERE {rollup_where} GROUP BY 1"
+        )
+        params = params + rollup_params
+
+    means = ', '.join(f'SUM({emo}_sum) / SUM(item_count) AS {emo}' for emo in EMOTIONS_NAMES)
+    sql = (
+        f"SELECT group_key, SUM(item_count) AS article_count, {means} FROM ({source}) "
+        f"GROUP BY group_key HAVING SUM(item_count) >= ? "
+        f"ORDER BY {order_by or 'group_key'} {'DESC' if descending and order_by else 'ASC'}"
+    )
+    if order_by is not None and order_by != 'article_count':
+        sql += ", article_count DESC"
+    params = params + [min_count]
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+
+    df = pd.read_sql(sql, conn, params=params)
+    df = df.rename(columns={'group_key': 'timestamp' if group_by != 'author' else 'author'})
+    if group_by != 'author':
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+    return df.set_index(df.columns[0])
+
+
+def top_authors(conn: sqlite3.Connection, board: str, emotion: str, start=None, end=None,
+                limit: int = 10, min_count: int = 1) -> pd.DataFrame:
+    """回傳時間範圍內某項情感平均分數最高的作者。"""
+    return aggregate_emotions(
+        conn, board, group_by='author', start=start, end=end,
+        order_by=emotion, min_count=min_count, limit=limit
+    )
+
+
+def _rollup_exists(conn: sqlite3.Connection, board: str) -> bool:
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (f'ptt_{board}_hourly',)
+    ).fetchone()
+    return row is not None
@@ -0,0 +1,171 @@
+# scoring_backends.py
+
+import numpy as np
+
+from config import EMOTIONS_NAMES
+
+
+class ScoringBackend:
+    """
+    情感計分後端介面。
+
+    子類別需實作 load() 與 score()；score() 接收文本列表，
+    回傳 [n, 8] 的分數矩陣，欄位順序與 config.EMOTIONS_NAMES 相同。
+    """
+
+    name = "base"
+
+    def __init__(self):
+        self.loaded = False
+
+    def load(self):
+        """載入模型等資源；可重複呼叫。"""
+        self.loaded = True
+        return self
+
+    def score(self, texts: list) -> np.ndarray:
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f"{type(self).__name__}(name={self.name!r}, loaded={self.loaded})"
+
+
+class LexiconBackend(ScoringBackend):
+    """現有的詞典與規則計分（SnowNLP 斷詞後套用否定詞與程度副詞規則，見 analyze_emotion_types）。"""
+
+    name = "lexicon"
+
+    def score(self, texts: list) -> np.ndarray:
+        from sentiment_analyzer import analyze_article_texts
+        return analyze_article_texts(list(texts))
+
+
+class OnnxBackend(ScoringBackend):
+    """
+    僅用 CPU 的量化 Transformer 模型後端（透過 onnxruntime）。
+
+    - 依長度排序後以 token 數上限動態組批，避免短文被長文的 padding 拖慢
+    - 序列長度對齊到 length_buckets，讓執行期可重用相同形狀的計算
+    - num_threads 控制 onnxruntime 的 intra-op 執行緒數
+
+    模型輸出需為 [batch, len(labels)] 的 logits，以 sigmoid 轉為 0-1 的多標籤分數。
+    需要額外安裝 onnxruntime 與 tokenizers。
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_path: str, tokenizer_path: str, labels: list = None,
+                 num_threads: int = 1, max_batch_tokens: int = 8192,
+                 length_buckets: tuple = (32, 64, 128, 256)):
+        super().__init__()
+        self.model_path = model_path
+        self.tokenizer_path = tokenizer_path
+        self.labels = list(labels or EMOTIONS_NAMES)
+        self.num_threads = num_threads
+        self.max_batch_tokens = max_batch_tokens
+        self.length_buckets = tuple(sorted(length_buckets))
+        self._session = None
+        self._tokenizer = None
+        self._input_names = ()
+
+        unknown = [label for label in self.labels if label not in EMOTIONS_NAMES]
+        if unknown:
+            raise ValueError(f"模型標籤不在 EMOTIONS_NAMES 中：{unknown}")
+
+    def load(self):
+        if self.loaded:
+            return self
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError("ONNX 後端需要安裝 onnxruntime 與 tokenizers：pip install onnxruntime tokenizers") from e
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.num_threads
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self._session = ort.InferenceSession(
+            self.model_path, sess_options=options, providers=['CPUExecutionProvider']
+        )
+        self._input_names = {i.name for i in self._session.get_inputs()}
+        self._tokenizer = Tokenizer.from_file(self.tokenizer_path)
+        self._tokenizer.enable_truncation(max_length=self.length_buckets[-1])
+        self.loaded = True
+        return self
+
+    def _bucket_length(self, length: int) -> int:
+        for bucket in self.length_buckets:
+            if length <= bucket:
+                return bucket
+        return self.length_buckets[-1]
+
+    def _batches(self, lengths: np.ndarray):
+        """依長度由短到長組批，每批的 batch_size * bucket_len 不超過 max_batch_tokens。"""
+        order = np.argsort(lengths, kind='stable')
+        batch = []
+        batch_bucket = 0
+        for idx in order:
+            bucket = self._bucket_length(int(lengths[idx]))
+            if batch and (bucket != batch_bucket or (len(batch) + 1) * bucket > self.max_batch_tokens):
+                yield batch_bucket, batch
+                batch = []
+            batch.append(int(idx))
+            batch_bucket = bucket
+        if batch:
+            yield batch_bucket, batch
+
+    def score(self, texts: list) -> np.ndarray:
+        self.load()
+        results = np.zeros((len(texts), len(EMOTIONS_NAMES)), dtype=np.float32)
+        if not texts:
+            return results
+
+        encodings = self._tokenizer.encode_batch([t if isinstance(t, str) else "" for t in texts])
+        lengths = np.array([len(e.ids) for e in encodings])
+        columns = [EMOTIONS_NAMES.index(label) for label in self.labels]
+
+        for bucket, batch in self._batches(lengths):
+            input_ids = np.zeros((len(batch), bucket), dtype=np.int64)
+            attention_mask = np.zeros((len(batch), bucket), dtype=np.int64)
+            for row, idx in enumerate(batch):
+                ids = encodings[idx].ids[:bucket]
+                input_ids[row, :len(ids)] = ids
+                attention_mask[row, :len(ids)] = 1
+
+            feeds = {'input_ids': input_ids, 'attention_mask': attention_mask}
+            if 'token_type_ids' in self._input_names:
+                feeds['token_type_ids'] = np.zeros_like(input_ids)
+            logits = self._session.run(None, {k: v for k, v in feeds.items() if k in self._input_names})[0]
+            probabilities = 1.0 / (1.0 + np.exp(-logits))
+            results[np.ix_(batch, columns)] = probabilities
+        return results
+
+
+SCORING_BACKENDS = {
+    LexiconBackend.name: LexiconBackend,
+    OnnxBackend.name: OnnxBackend,
+}
+
+_loaded_backends = {}
+
+
+def get_scoring_backend(name: str = "lexicon", **options) -> ScoringBackend:
+    """
+    依名稱取得已載入的計分後端；相同名稱與參數的後端在行程內只載入一次。
+
+    參數:
+        name: 後端名稱（見 SCORING_BACKENDS）
+        options: 傳給後端建構子的參數
+
+    返回:
+        已呼叫過 load() 的 ScoringBackend
+    """
+    if name not in SCORING_BACKENDS:
+        raise ValueError(f"未知的計分後端：{name}（可用：{', '.join(SCORING_BACKENDS)}）")
+    cache_key = (name, tuple(sorted((k, repr(v)) for k, v in options.items())))
+    backend = _loaded_backends.get(cache_key)
+    if backend is None:
+        backend = SCORING_BACKENDS[name](**options).load()
+        _loaded_backends[cache_key] = backend
+    return backend
@@ -0,0 +1,216 @@
+# search.py
+
+import re
+import sqlite3
+
+import pandas as pd
+
+from config import EMOTIONS_NAMES
+from storage import TIMESTAMP_FORMAT, board_table
+from query import GROUP_BY_EXPRESSIONS, _escape_like
+
+# --- CJK 二元切分 ---
+# FTS5 內建的 unicode61 不會切分中文，trigram 又無法查詢兩個字的關鍵字；
+# 因此先把中文連續字串切成重疊的二元組（「伊朗到底」→「伊朗 朗到 到底」），
+# 英數字則保留整個詞，再交給 unicode61 以空白斷詞建立索引。
+TOKEN_RUN_PATTERN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[A-Za-z0-9]+')
+CJK_CHAR_PATTERN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]')
+
+
+def to_bigrams(text: str) -> list:
+    """將文本切分為索引用的詞：中文為重疊二元組，英數字為整個詞（小寫）。"""
+    if not isinstance(text, str) or not text:
+        return []
+    tokens = []
+    for run in TOKEN_RUN_PATTERN.findall(text):
+        if CJK_CHAR_PATTERN.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run.lower())
+    return tokens
+
+
+def build_match_query(keyword: str, columns: tuple = ('title', 'content')) -> str:
+    """
+    將關鍵字轉為 FTS5 MATCH 語法，用來縮小候選文章；結果是含有該子字串的文章的超集合，
+    不是精確的子字串比對，呼叫端須再以 LIKE 確認（見 _matching_filter）。
+
+    索引只有中文二元組與完整的英數字詞，因此只取索引能保證命中的詞：
+    - 兩字以上的中文連續字串：其中每個二元組
+    - 英數字詞：位於關鍵字中間時為完整的詞；位於結尾時以前綴查詢（「TSM」也要找到「TSMC」）；
+      位於開頭時可能是較長詞的後半段，無法以索引查詢而略過
+    - 單一中文字（如「A股」的「股」）在文本中會被併入二元組，同樣略過
+
+    沒有可用的詞時回傳空字串，呼叫端應改以 LIKE 掃描。
+    """
+    keyword = keyword.strip() if isinstance(keyword, str) else ''
+    terms = []
+    for match in TOKEN_RUN_PATTERN.finditer(keyword):
+        run = match.group()
+        if CJK_CHAR_PATTERN.match(run):
+            terms.extend(f'"{bigram}"' for bigram in to_bigrams(run) if len(bigram) == 2)
+        elif match.start() > 0:
+            term = '"' + run.lower() + '"'
+            terms.append(term + '*' if match.end() == len(keyword) else term)
+    if not terms:
+        return ""
+    return f"{{{' '.join(columns)}}} : ({' AND '.join(dict.fromkeys(terms))})"
+
+
+# --- 索引維護 ---
+
+def fts_table(board: str) -> str:
+    return board_table(board, '_fts')
+
+
+def ensure_fts_schema(conn: sqlite3.Connection, board: str):
+    """
+    建立看板的全文索引表；第一次建立時會為既有文章補建索引。
+
+    索引表是 contentless（content=''），不另存一份二元組文字，只能以 rowid 取得符合的文章。
+    刪除索引列須以 FTS5 的 'delete' 指令提供當初索引的詞，因此文章的標題或內文變動前
+    都要先呼叫 unindex_articles。舊版保存內容的索引表會被重建。
+    """
+    row = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (f'ptt_{board}_fts',)
+    ).fetchone()
+    if row and "content=''" in row[0]:
+        return
+    if row:
+        conn.execute(f"DROP TABLE {fts_table(board)}")
+    conn.execute(
+        f"CREATE VIRTUAL TABLE {fts_table(board)} USING fts5(title, content, content='', tokenize='unicode61')"
+    )
+    ids = [row[0] for row in conn.execute(f"SELECT id FROM {board_table(board)}")]
+    index_articles(conn, board, ids)
+
+
+def _index_rows(rows) -> list:
+    return [(row_id, ' '.join(to_bigrams(title)), ' '.join(to_bigrams(content))) for row_id, title, content in rows]
+
+
+def _select_chunks(conn: sqlite3.Connection, board: str, ids: list, chunk_size: int):
+    ids = list(ids)
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        placeholders = ', '.join('?' for _ in chunk)
+        yield conn.execute(
+            f"SELECT id, title, content FROM {board_table(board)} WHERE id IN ({placeholders})", chunk
+        ).fetchall()
+
+
+def _delete_index_rows(conn: sqlite3.Connection, board: str, rows):
+    fts = fts_table(board)
+    conn.executemany(
+        f"INSERT INTO {fts} ({fts}, rowid, title, content) VALUES ('delete', ?, ?, ?)", _index_rows(rows)
+    )
+
+
+def unindex_articles(conn: sqlite3.Connection, board: str, ids: list, chunk_size: int = 500):
+    """
+    以文章表目前的標題與內文移除其全文索引列；須在變更文章之前、同一個交易內呼叫。
+    只能傳入已建立索引的文章，否則會破壞 contentless 索引。
+    """
+    for rows in _select_chunks(conn, board, ids, chunk_size):
+        _delete_index_rows(conn, board, rows)
+
+
+def index_articles(conn: sqlite3.Connection, board: str, ids: list, chunk_size: int = 500):
+    """
+    依文章 id 建立其全文索引列。內文已被保留政策清除的文章只索引標題。
+    全文索引的 rowid 與文章表的 id 相同；已有索引的文章須先以 unindex_articles 移除。
+    """
+    fts = fts_table(board)
+    for rows in _select_chunks(conn, board, ids, chunk_size):
+        conn.executemany(f"INSERT INTO {fts} (rowid, title, content) VALUES (?, ?, ?)", _index_rows(rows))
+    conn.commit()
+
+
+def remove_from_index(conn: sqlite3.Connection, board: str, start: str, end: str):
+    """移除 [start, end) 時間範圍內文章的全文索引列；須在刪除文章之前呼叫。"""
+    _delete_index_rows(conn, board, conn.execute(
+        f"SELECT id, title, content FROM {board_table(board)} WHERE timestamp >= ? AND timestamp < ?",
+        (start, end)
+    ))
+
+
+# --- 查詢 ---
+
+def _time_filter(start, end) -> tuple:
+    clauses, params = [], []
+    if start is not None:
+        clauses.append("a.timestamp >= ?")
+        params.append(pd.to_datetime(start).strftime(TIMESTAMP_FORMAT))
+    if end is not None:
+        clauses.append("a.timestamp < ?")
+        params.append(pd.to_datetime(end).strftime(TIMESTAMP_FORMAT))
+    return (' AND '.join(clauses) or '1'), params
+
+
+def _matching_filter(board, keyword, columns) -> tuple:
+    """
+    回傳 (FROM 子句, 條件, 參數)，條件為標題或內文含有關鍵字（子字串比對）。
+    可用索引時先以 MATCH 子查詢取得候選 rowid，只對候選文章做 LIKE 確認；
+    關鍵字沒有可用索引的詞（如單一中文字）時直接以 LIKE 掃描。
+    """
+    condition = '(' + ' OR '.join(f"a.{c} LIKE ? ESCAPE '\\'" for c in columns) + ')'
+    like_params = [f"%{_escape_like(keyword)}%"] * len(columns)
+    match = build_match_query(keyword, columns)
+    if match:
+        source = (
+            f"{board_table(board)} AS a JOIN (SELECT rowid FROM {fts_table(board)} "
+            f"WHERE {fts_table(board)} MATCH ?) AS m ON a.id = m.rowid"
+        )
+        return source, condition, [match] + like_params
+    return f"{board_table(board)} AS a", condition, like_params
+
+
+def search_articles(conn: sqlite3.Connection, board: str, keyword: str, start=None, end=None,
+                    columns: tuple = ('title', 'content'), limit: int = 50) -> pd.DataFrame:
+    """
+    以全文索引搜尋標題或內文含有關鍵字的文章，依時間由新到舊排序。
+
+    參數:
+        conn: SQLite 連線
+        board: 看板名稱
+        keyword: 關鍵字
+        start, end: 時間範圍 [start, end)
+        columns: 要搜尋的欄位
+        limit: 最多回傳筆數
+
+    返回:
+        含 id、timestamp、title、author 與各情感分數的 DataFrame
+    """
+    source, condition, params = _matching_filter(board, keyword, columns)
+    where, time_params = _time_filter(start, end)
+    select_columns = ', '.join(f'a.{c}' for c in ['id', 'timestamp', 'title', 'author'] + EMOTIONS_NAMES)
+    sql = f"SELECT {select_columns} FROM {source} WHERE {condition} AND {where} ORDER BY a.timestamp DESC LIMIT ?"
+    df = pd.read_sql(sql, conn, params=params + time_params + [limit])
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    return df
+
+
+def keyword_emotion_trend(conn: sqlite3.Connection, board: str, keyword: str, group_by: str = 'hour',
+                          start=None, end=None, columns: tuple = ('title', 'content')) -> pd.DataFrame:
+    """
+    計算提及關鍵字的文章的分組情感平均分數，由全文索引取得符合的文章集合。
+
+    返回:
+        以時間為索引，含 article_count 與各情感平均分數的 DataFrame
+    """
+    if group_by not in ('hour', 'day'):
+        raise ValueError(f"不支援的分組方式：{group_by}")
+    source, condition, params = _matching_filter(board, keyword, columns)
+    where, time_params = _time_filter(start, end)
+    key = GROUP_BY_EXPRESSIONS[group_by].replace('timestamp', 'a.timestamp')
+    means = ', '.join(f'AVG(a.{emo}) AS {emo}' for emo in EMOTIONS_NAMES)
+    sql = (
+        f"SELECT {key} AS timestamp, COUNT(*) AS article_count, {means} "
+        f"FROM {source} WHERE {condition} AND {where} GROUP BY 1 ORDER BY 1"
+    )
+    df = pd.read_sql(sql, conn, params=params + time_params)
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    return df.set_index('timestamp')
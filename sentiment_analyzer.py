@@ -1,7 +1,10 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
+import datetime
 from snownlp import SnowNLP # 導入 SnowNLP
+from dedup import FingerprintIndex, strip_quoted_text
+from lexicon import LexiconStore
 # 移除 matplotlib 開頭匯入，改為延遲載入
 # import matplotlib.pyplot as plt
 # import matplotlib.font_manager as fm # 用於設置中文字體
@@ -70,6 +73,17 @@ emotion_coordinates = {
     "trust": (0.7, -0.2), "neutral": (0.0, 0.0)
 }
 
+# 目前生效的詞典：上方為內建預設值，config.LEXICON_PATH 指定的外部檔案存在時會覆蓋並熱重載
+def _create_lexicon_store():
+    from config import LEXICON_PATH, LEXICON_RELOAD_SECONDS
+    return LexiconStore(LEXICON_PATH, check_interval=LEXICON_RELOAD_SECONDS)
+
+lexicon_store = _create_lexicon_store()
+
+def get_active_lexicon():
+    """回傳目前生效的詞典（lexicon.Lexicon）。"""
+    return lexicon_store.get()
+
 # --- 輔助函數 ---
 
 def split_paragraphs(text):
@@ -108,11 +122,28 @@ def analyze_emotion_types(text: str, emotion_lexicon: dict, negation_words: list
     返回:
         包含各情感類型分數的字典 (0-1，歸一化)。
     """
-    overall_emotion_scores = {emotion_type: 0 for emotion_type in emotion_lexicon.keys()}
-    total_words_processed = 0
+    # 整篇都是引文時，剝除後可能沒有任何內容
+    if not text.strip():
+        return {emotion_type: 0.0 for emotion_type in emotion_lexicon.keys()}
 
     s = SnowNLP(text)
-    words = s.words
+    return score_emotion_words(s.words, emotion_lexicon, negation_words, degree_adverbs)
+
+def score_emotion_words(words: list, emotion_lexicon: dict, negation_words: list, degree_adverbs: dict) -> dict:
+    """
+    對已斷好的詞序列套用否定詞與程度副詞規則，計算八項情感分數。
+
+    參數:
+        words: 詞序列
+        emotion_lexicon: 情感詞典
+        negation_words: 否定詞列表
+        degree_adverbs: 程度副詞列表
+
+    返回:
+        包含各情感類型分數的字典 (0-1，歸一化)。
+    """
+    overall_emotion_scores = {emotion_type: 0 for emotion_type in emotion_lexicon.keys()}
+    total_words_processed = 0
 
     for i, word in enumerate(words):
         is_negated = False
@@ -174,44 +205,252 @@ def analyze_emotion_types(text: str, emotion_lexicon: dict, negation_words: list
 
     return overall_emotion_scores
 
+# --- 短文本（推文）快速分析 ---
+# 推文通常不到一行，數量卻是文章的數百倍；SnowNLP 斷詞對這種量級太慢，
+# 改用詞典正向最大匹配直接查表。
+SHORT_TEXT_MAX_CHARS = 40
+
+_lexicon_vocabulary_cache = {}
+
+def _lexicon_vocabulary(emotion_lexicon: dict, negation_words: list, degree_adverbs: dict):
+    """建立（並快取）詞典、否定詞與程度副詞的合併詞表，以及最長詞長度。"""
+    # 快取同時保留詞典物件本身的參照，避免詞典被熱重載替換後 id 被重複使用
+    cache_key = (id(emotion_lexicon), id(negation_words), id(degree_adverbs))
+    entry = _lexicon_vocabulary_cache.get(cache_key)
+    cached = entry[1] if entry is not None else None
+    if cached is None:
+        vocabulary = set(negation_words)
+        for words in emotion_lexicon.values():
+            vocabulary.update(words)
+        for adverbs in degree_adverbs.values():
+            vocabulary.update(adverbs)
+        max_len = max((len(w) for w in vocabulary), default=1)
+        cached = (frozenset(vocabulary), max_len)
+        _lexicon_vocabulary_cache.clear()
+        _lexicon_vocabulary_cache[cache_key] = ((emotion_lexicon, negation_words, degree_adverbs), cached)
+    return cached
+
+def segment_by_lexicon(text: str, vocabulary, max_len: int) -> list:
+    """
+    以正向最大匹配切分文本：詞表內的詞整段切出，其餘字元各自成為一個詞。
+
+    參數:
+        text: 要切分的文本
+        vocabulary: 詞表
+        max_len: 詞表中最長詞的長度
+
+    返回:
+        詞序列
+    """
+    words = []
+    i = 0
+    n = len(text)
+    while i < n:
+        for length in range(min(max_len, n - i), 0, -1):
+            candidate = text[i:i + length]
+            if length == 1 or candidate in vocabulary:
+                words.append(candidate)
+                i += length
+                break
+    return words
+
+def analyze_short_texts(texts: list, emotion_lexicon: dict = None, negation_words: list = None,
+                        degree_adverbs: dict = None, max_chars: int = SHORT_TEXT_MAX_CHARS) -> np.ndarray:
+    """
+    批次分析大量短文本（如推文），回傳 [n, 8] 的情感分數矩陣。
+
+    長度不超過 max_chars 的文本以詞典直接查表，
+    較長的文本才交給 SnowNLP 斷詞；重複的文本只計算一次。
+    查表的切分與 SnowNLP 斷詞不同（例如「非常生氣」會切出程度副詞與情感詞），分數可能與
+    analyze_emotion_types 不同，因此文章內文請用 analyze_article_texts。
+
+    參數:
+        texts: 文本列表
+        emotion_lexicon: 情感詞典，預設使用目前生效的詞典
+        negation_words: 否定詞列表
+        degree_adverbs: 程度副詞列表
+        max_chars: 以詞典直接查表的文本長度上限；0 表示全部交給 SnowNLP
+
+    返回:
+        欄位順序與 config.EMOTIONS_NAMES 相同的 numpy 陣列
+    """
+    from config import EMOTIONS_NAMES
+
+    active = get_active_lexicon()
+    emotion_lexicon = emotion_lexicon if emotion_lexicon is not None else active.emotion_lexicon
+    negation_words = negation_words if negation_words is not None else active.negation_words
+    degree_adverbs = degree_adverbs if degree_adverbs is not None else active.degree_adverbs
+    vocabulary, max_len = _lexicon_vocabulary(emotion_lexicon, negation_words, degree_adverbs)
+
+    results = np.zeros((len(texts), len(EMOTIONS_NAMES)), dtype=np.float32)
+    row_by_text = {}
+    for n, text in enumerate(texts):
+        if not isinstance(text, str):
+            continue
+        text = text.strip()
+        if not text:
+            continue
+        if text in row_by_text:
+            results[n] = results[row_by_text[text]]
+            continue
+
+        if len(text) <= max_chars:
+            words = segment_by_lexicon(text, vocabulary, max_len)
+            if not any(w in vocabulary for w in words):
+                row_by_text[text] = n  # 沒有命中任何詞，分數保持為 0
+                continue
+            emotion_scores = score_emotion_words(words, emotion_lexicon, negation_words, degree_adverbs)
+        else:
+            emotion_scores = analyze_emotion_types(text, emotion_lexicon, negation_words, degree_adverbs)
+
+        results[n] = [emotion_scores.get(emo, 0.0) for emo in EMOTIONS_NAMES]
+        row_by_text[text] = n
+    return results
+
+def analyze_article_texts(texts: list, emotion_lexicon: dict = None, negation_words: list = None,
+                          degree_adverbs: dict = None) -> np.ndarray:
+    """
+    批次分析文章內文，回傳 [n, 8] 的情感分數矩陣。每篇都以 analyze_emotion_types（SnowNLP 斷詞）
+    計分，與逐篇分析的結果相同，不論文章長短；重複的文本只計算一次。
+    """
+    return analyze_short_texts(texts, emotion_lexicon, negation_words, degree_adverbs, max_chars=0)
+
+def analyze_push_batch(pushes_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    對推文 DataFrame 的 text 欄位進行情感分析，並將八項情感分數加入到 DataFrame 中。
+    """
+    if pushes_df.empty:
+        return pushes_df
+
+    from config import EMOTIONS_NAMES
+
+    scores = analyze_short_texts(pushes_df['text'].tolist())
+    for n, emo in enumerate(EMOTIONS_NAMES):
+        pushes_df[emo] = scores[:, n]
+    return pushes_df
+
 # Streamlit 應用程序將會調用這個函數
-def get_sentiment_model():
+def get_sentiment_model(board: str = None):
     """
-    這個函數在這裡只是為了兼容 app.py 的接口，
-    實際上不載入任何模型，因為情感分析是基於詞典和規則。
+    取得看板使用的情感計分後端（見 scoring_backends.py）。
+    預設為詞典與規則後端；config.BOARD_SCORING_BACKENDS 可為個別看板指定其他後端。
     """
-    return "dictionary_based_model" # 返回一個標誌，表示已準備好
+    from config import SCORING_BACKEND, BOARD_SCORING_BACKENDS, SCORING_BACKEND_OPTIONS
+    from scoring_backends import get_scoring_backend
+
+    name = BOARD_SCORING_BACKENDS.get(board, SCORING_BACKEND)
+    return get_scoring_backend(name, **SCORING_BACKEND_OPTIONS.get(name, {}))
 
-def analyze_sentiment_batch(df: pd.DataFrame, model_placeholder) -> pd.DataFrame:
+SCORING_CHUNK_SIZE = 64  # 每批送進計分後端的文章數，同時用於更新進度條
+
+def load_repost_history(conn, board: str, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    讀取看板中可能被 df 的文章轉貼的既有文章，作為 analyze_sentiment_batch 的 history：
+    發文時間介於 df 最早文章前 DEDUP_WINDOW_HOURS 小時到最晚文章之間、仍保留內文的文章。
+
+    返回:
+        含 timestamp、title、author、content 與八項情感分數的 DataFrame；看板尚無資料時為空
+    """
+    from config import EMOTIONS_NAMES, DEDUP_WINDOW_HOURS
+    from query import iter_articles
+
+    if df.empty or conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (f'ptt_{board}',)
+    ).fetchone() is None:
+        return pd.DataFrame()
+    timestamps = pd.to_datetime(df['timestamp'])
+    chunks = [
+        chunk[chunk['content'].notna()]
+        for chunk in iter_articles(
+            conn, board,
+            start=timestamps.min() - datetime.timedelta(hours=DEDUP_WINDOW_HOURS),
+            end=timestamps.max() + datetime.timedelta(seconds=1),
+            columns=['timestamp', 'title', 'author', 'content'] + EMOTIONS_NAMES
+        )
+    ]
+    return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+
+def analyze_sentiment_batch(df: pd.DataFrame, model=None, show_progress: bool = True,
+                            history: pd.DataFrame = None) -> pd.DataFrame:
     """
     對 DataFrame 中的文章內容進行情感分析，並將八項情感分數加入到 DataFrame 中。
-    此函數現在使用基於詞典的分析方法。
+    先剝除引文並偵測轉貼，再把需要計分的文本分批交給 model（ScoringBackend）。
+    show_progress=False 時不輸出 Streamlit 訊息（供背景工作者使用）。
+    history 為已寫入的既有文章（見 load_repost_history），與其近似重複的文章也視為轉貼並沿用其分數，
+    讓轉貼偵測不限於同一批抓取的文章；與 df 中同一篇文章（相同時間、標題、作者）的舊版本不列入比對。
     """
     if df.empty:
         return df
 
-    st.write("✨ 正在使用詞典和規則進行情感分析...")
-    
-    from config import EMOTIONS_NAMES # 從 config 導入情感名稱
+    from config import EMOTIONS_NAMES, DEDUP_SIMILARITY_THRESHOLD, DEDUP_WINDOW_HOURS # 從 config 導入情感名稱
+    from scoring_backends import ScoringBackend
+
+    if not isinstance(model, ScoringBackend):
+        model = get_sentiment_model()
+    if show_progress:
+        st.write(f"✨ 正在使用 {model.name} 後端進行情感分析...")
 
     for emo in EMOTIONS_NAMES:
         df[emo] = 0.0
+    df['is_repost'] = False
+
+    # 依時間順序處理（既有文章與本批次文章交錯），讓指紋索引能淘汰時間窗外的舊文章
+    fingerprint_index = FingerprintIndex(
+        threshold=DEDUP_SIMILARITY_THRESHOLD,
+        window=datetime.timedelta(hours=DEDUP_WINDOW_HOURS)
+    )
+    timestamps = pd.to_datetime(df['timestamp'])
+    entries = [(timestamps.at[i], 1, i) for i in df.index]
+    if history is not None and not history.empty:
+        batch_keys = set(zip(timestamps, df['title'].fillna(''), df['author'].fillna('')))
+        history_timestamps = pd.to_datetime(history['timestamp'])
+        for j, timestamp, title, author in zip(history.index, history_timestamps, history['title'], history['author']):
+            if (timestamp, title, author) not in batch_keys:
+                # 同一時間的既有文章排在本批次文章之前，作為原文
+                entries.append((timestamp, 0, ('history', j)))
+    entries.sort(key=lambda entry: entry[:2])
+
+    novel_index, novel_texts = [], []
+    duplicates = {}
+
+    for timestamp, _, key in entries:
+        if isinstance(key, tuple):
+            # 既有文章只加入索引，不重新計分
+            fingerprint_index.find_or_add(key, strip_quoted_text(history.at[key[1], 'content']), timestamp)
+            continue
+        # 只分析本篇新寫的內容，引文部分已在原文中計分過
+        text = strip_quoted_text(df.at[key, 'content'])
+        duplicate_of = fingerprint_index.find_or_add(key, text, timestamp)
+        if duplicate_of is not None:
+            duplicates[key] = duplicate_of
+        else:
+            novel_index.append(key)
+            novel_texts.append(text)
 
     progress_text = "情感分析進度："
-    my_bar = st.progress(0, text=progress_text)
-
-    for i, row in df.iterrows():
-        text = row['content']
-        emotion_scores = analyze_emotion_types(text, emotion_lexicon, negation_words, degree_adverbs)
-        
-        for emo in EMOTIONS_NAMES:
-            df.loc[i, emo] = emotion_scores.get(emo, 0.0)
-
-        my_bar.progress((i + 1) / len(df), text=progress_text + f"{i+1}/{len(df)} 條文章")
+    my_bar = st.progress(0, text=progress_text) if show_progress else None
+
+    scores = np.zeros((len(novel_texts), len(EMOTIONS_NAMES)), dtype=np.float32)
+    for start in range(0, len(novel_texts), SCORING_CHUNK_SIZE):
+        end = min(start + SCORING_CHUNK_SIZE, len(novel_texts))
+        scores[start:end] = model.score(novel_texts[start:end])
+        if my_bar is not None:
+            my_bar.progress(end / len(novel_texts), text=progress_text + f"{end}/{len(novel_texts)} 條文章")
+
+    df.loc[novel_index, EMOTIONS_NAMES] = scores
+    if duplicates:
+        # 轉貼沿用原文（本批次或既有文章）的分數
+        df.loc[list(duplicates), EMOTIONS_NAMES] = np.array([
+            history.loc[source[1], EMOTIONS_NAMES] if isinstance(source, tuple) else df.loc[source, EMOTIONS_NAMES]
+            for source in duplicates.values()
+        ], dtype=float)
+        df.loc[list(duplicates), 'is_repost'] = True
     
-    my_bar.empty()
-
-    st.write("✅ 情感分析完成。")
+    if my_bar is not None:
+        my_bar.empty()
+        if duplicates:
+            st.write(f"♻️ 偵測到 {len(duplicates)} 篇轉貼或近似重複文章，已沿用原文分數。")
+        st.write("✅ 情感分析完成。")
     return df
 
 # 注意：visualize_sentiment_flow 和 annotate_text_sentiment 函數
@@ -0,0 +1,447 @@
+# storage.py
+
+import re
+import datetime
+import sqlite3
+
+import pandas as pd
+
+from config import EMOTIONS_NAMES
+
+# --- 資料表命名 ---
+# 看板名稱含有「-」（如 Boy-Girl），作為表名時必須加上雙引號
+BOARD_NAME_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+ARTICLE_COLUMNS = ['timestamp', 'title', 'author', 'board', 'content', 'is_repost'] + EMOTIONS_NAMES
+PUSH_COLUMNS = ['article_id', 'timestamp', 'tag', 'user', 'text'] + EMOTIONS_NAMES
+
+
+def board_table(board: str, suffix: str = '') -> str:
+    """回傳看板資料表的識別字（已加引號），並拒絕不合法的看板名稱。"""
+    if not BOARD_NAME_PATTERN.match(board or ''):
+        raise ValueError(f"不合法的看板名稱：{board!r}")
+    return f'"ptt_{board}{suffix}"'
+
+
+def _table_exists(conn: sqlite3.Connection, name: str) -> bool:
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (name.strip('"'),)
+    ).fetchone()
+    return row is not None
+
+
+def _table_columns(conn: sqlite3.Connection, table: str) -> list:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def _format_timestamps(series: pd.Series) -> pd.Series:
+    return pd.to_datetime(series).dt.strftime(TIMESTAMP_FORMAT)
+
+
+def _existing_articles(conn: sqlite3.Connection, table: str, keys, chunk_size: int = 300) -> dict:
+    """以 (timestamp, title, author) 鍵批次查詢既有文章，回傳 鍵 -> (id, content)。"""
+    keys = list(keys)
+    existing = {}
+    for start in range(0, len(keys), chunk_size):
+        chunk = keys[start:start + chunk_size]
+        values = ', '.join('(?, ?, ?)' for _ in chunk)
+        # 以 VALUES 為外層逐鍵查詢唯一索引（row-value IN 會掃描整個索引）
+        rows = conn.execute(
+            f"SELECT a.id, a.content, a.timestamp, a.title, a.author FROM (VALUES {values}) AS k "
+            f"JOIN {table} AS a ON a.timestamp = k.column1 AND a.title = k.column2 AND a.author = k.column3",
+            [v for key in chunk for v in key]
+        )
+        for row_id, content, *key in rows:
+            existing[tuple(key)] = (row_id, content)
+    return existing
+
+
+# --- 結構建立與遷移 ---
+
+def enable_incremental_vacuum(conn: sqlite3.Connection):
+    """
+    將資料庫切換為 auto_vacuum=INCREMENTAL。
+    既有資料庫需要一次完整 VACUUM 才會生效，之後只需做增量回收。
+    """
+    mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    if mode != 2:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.commit()
+        conn.execute("VACUUM")
+
+
+def ensure_board_schema(conn: sqlite3.Connection, board: str):
+    """
+    建立看板的文章表、推文表與每小時彙總表。
+
+    文章表以 (timestamp, title, author) 作為唯一鍵，寫入時以 upsert 更新，
+    不再整表覆寫；舊版以 to_sql(replace) 建立的表會被遷移到新結構。
+    """
+    table = board_table(board)
+    emotion_columns = ', '.join(f'{emo} REAL NOT NULL DEFAULT 0' for emo in EMOTIONS_NAMES)
+    create_articles = f"""
+        CREATE TABLE IF NOT EXISTS {{table}} (
+            id INTEGER PRIMARY KEY,
+            timestamp TEXT NOT NULL,
+            title TEXT NOT NULL,
+            author TEXT NOT NULL,
+            board TEXT,
+            content TEXT,
+            is_repost INTEGER NOT NULL DEFAULT 0,
+            {emotion_columns},
+            UNIQUE (timestamp, title, author)
+        )
+    """
+
+    if _table_exists(conn, table) and 'id' not in _table_columns(conn, table):
+        legacy = board_table(board, '_legacy')
+        conn.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+        conn.execute(create_articles.format(table=table))
+        shared = [c for c in ARTICLE_COLUMNS if c in _table_columns(conn, legacy)]
+        column_list = ', '.join(shared)
+        conn.execute(
+            f"INSERT OR IGNORE INTO {table} ({column_list}) "
+            f"SELECT {column_list} FROM {legacy} ORDER BY timestamp"
+        )
+        conn.execute(f"DROP TABLE {legacy}")
+    else:
+        conn.execute(create_articles.format(table=table))
+
+    conn.execute(
+        f'CREATE INDEX IF NOT EXISTS "idx_ptt_{board}_timestamp" ON {table} (timestamp)'
+    )
+    conn.execute(
+        f'CREATE INDEX IF NOT EXISTS "idx_ptt_{board}_author_timestamp" ON {table} (author, timestamp)'
+    )
+
+    # 推文表以整數 article_id 參照文章表的 id，不重複儲存文章網址；
+    # 舊版以 article_url 參照的推文無法對應到文章，遷移時 article_id 為 NULL
+    push_table = board_table(board, '_pushes')
+    emotion_columns_nullable = ', '.join(f'{emo} REAL' for emo in EMOTIONS_NAMES)
+    create_pushes = f"""
+        CREATE TABLE IF NOT EXISTS {{table}} (
+            article_id INTEGER,
+            timestamp TEXT,
+            tag INTEGER,
+            user TEXT,
+            text TEXT,
+            {emotion_columns_nullable}
+        )
+    """
+    if _table_exists(conn, push_table) and 'article_id' not in _table_columns(conn, push_table):
+        legacy = board_table(board, '_pushes_legacy')
+        conn.execute(f"ALTER TABLE {push_table} RENAME TO {legacy}")
+        conn.execute(create_pushes.format(table=push_table))
+        shared = [c for c in PUSH_COLUMNS if c in _table_columns(conn, legacy)]
+        column_list = ', '.join(shared)
+        conn.execute(f"INSERT INTO {push_table} ({column_list}) SELECT {column_list} FROM {legacy}")
+        conn.execute(f"DROP TABLE {legacy}")
+    else:
+        conn.execute(create_pushes.format(table=push_table))
+    conn.execute(
+        f'CREATE INDEX IF NOT EXISTS "idx_ptt_{board}_pushes_timestamp" ON {push_table} (timestamp)'
+    )
+    conn.execute(
+        f'CREATE INDEX IF NOT EXISTS "idx_ptt_{board}_pushes_article" ON {push_table} (article_id)'
+    )
+
+    # 已彙總進每小時彙總表的時間上界；早於此時間的列不可再寫入，否則會被重複彙總
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS retention_state (
+            board TEXT PRIMARY KEY,
+            articles_rolled_up_before TEXT NOT NULL DEFAULT '',
+            pushes_rolled_up_before TEXT NOT NULL DEFAULT ''
+        )
+    """)
+
+    sum_columns = ', '.join(f'{emo}_sum REAL NOT NULL DEFAULT 0' for emo in EMOTIONS_NAMES)
+    for suffix in ('_hourly', '_pushes_hourly'):
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {board_table(board, suffix)} (
+                hour TEXT PRIMARY KEY,
+                item_count INTEGER NOT NULL DEFAULT 0,
+                {sum_columns}
+            )
+        """)
+    conn.commit()
+
+    from search import ensure_fts_schema
+    from lexicon import ensure_lexicon_schema
+    ensure_fts_schema(conn, board)
+    ensure_lexicon_schema(conn, board)
+
+
+# --- 寫入 ---
+
+def upsert_articles(conn: sqlite3.Connection, board: str, df: pd.DataFrame, lexicon=None) -> int:
+    """
+    以 (timestamp, title, author) 為鍵 upsert 文章與情感分數。
+    衝突時就地更新，保留原本的 rowid，方便其他索引以 id 參照文章；
+    只有新文章或內文有變動的文章會重建全文索引與詞典反向索引
+    （lexicon 為計分所用的詞典，預設為目前生效的詞典）。
+    早於已彙總時段的文章已計入每小時彙總表，會被略過以免重複計算。
+
+    返回:
+        寫入的列數
+    """
+    if df.empty:
+        return 0
+
+    table = board_table(board)
+    rows = df.copy()
+    rows['timestamp'] = _format_timestamps(rows['timestamp'])
+    rows = rows[rows['timestamp'] >= rolled_up_before(conn, board)]
+    if rows.empty:
+        return 0
+    for column in ARTICLE_COLUMNS:
+        if column not in rows.columns:
+            rows[column] = 0.0 if column in EMOTIONS_NAMES else None
+    rows['board'] = rows['board'].fillna(board)
+    rows['is_repost'] = rows['is_repost'].eq(True).astype(int)
+    rows['title'] = rows['title'].fillna('')
+    rows['author'] = rows['author'].fillna('')
+
+    column_list = ', '.join(ARTICLE_COLUMNS)
+    placeholders = ', '.join('?' for _ in ARTICLE_COLUMNS)
+    updates = ', '.join(
+        f'{c} = COALESCE(excluded.{c}, {c})' if c == 'content' else f'{c} = excluded.{c}'
+        for c in ARTICLE_COLUMNS if c not in ('timestamp', 'title', 'author')
+    )
+    records = list(
+        rows[ARTICLE_COLUMNS].astype(object).where(rows[ARTICLE_COLUMNS].notna(), None)
+        .itertuples(index=False, name=None)
+    )
+
+    # 寫入前後各以分塊批次查詢比對既有文章，不逐筆查詢
+    key_positions = [ARTICLE_COLUMNS.index(c) for c in ('timestamp', 'title', 'author')]
+    content_position = ARTICLE_COLUMNS.index('content')
+    keys = [tuple(record[p] for p in key_positions) for record in records]
+    existing = _existing_articles(conn, table, set(keys))
+    changed_keys = {
+        key for key, record in zip(keys, records)
+        if key not in existing or (record[content_position] is not None and record[content_position] != existing[key][1])
+    }
+
+    from search import index_articles, unindex_articles
+    from lexicon import index_article_terms
+    from sentiment_analyzer import get_active_lexicon
+    # 全文索引以寫入前的內文移除舊列，與寫入及重建索引在同一個交易內提交
+    unindex_articles(conn, board, [existing[key][0] for key in changed_keys if key in existing])
+    conn.executemany(
+        f"INSERT INTO {table} ({column_list}) VALUES ({placeholders}) "
+        f"ON CONFLICT (timestamp, title, author) DO UPDATE SET {updates}",
+        records
+    )
+    changed_ids = [row_id for row_id, _ in _existing_articles(conn, table, changed_keys).values()]
+    index_articles(conn, board, changed_ids)
+    index_article_terms(conn, board, changed_ids, lexicon or get_active_lexicon())
+    return len(rows)
+
+
+def lookup_article_ids(conn: sqlite3.Connection, board: str, df: pd.DataFrame, chunk_size: int = 300) -> pd.Series:
+    """
+    依 (timestamp, title, author) 查詢文章表的 id，每個分塊只查詢一次。
+
+    返回:
+        與 df 索引對齊的 id Series；尚未寫入的文章為 NaN
+    """
+    if df.empty:
+        return pd.Series(dtype=float, index=df.index)
+    keys = list(zip(_format_timestamps(df['timestamp']), df['title'].fillna(''), df['author'].fillna('')))
+    existing = _existing_articles(conn, board_table(board), set(keys), chunk_size)
+    return pd.Series([existing[key][0] if key in existing else None for key in keys],
+                     index=df.index, dtype=float)
+
+
+def resolve_push_article_ids(conn: sqlite3.Connection, board: str, articles_df: pd.DataFrame,
+                             pushes_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    以 articles_df 的 url 欄位將推文的 article_url 對應到文章 id（文章須已寫入）。
+    對應不到文章的推文會被捨棄。
+    """
+    if pushes_df.empty or articles_df.empty or 'url' not in articles_df.columns:
+        return pushes_df.iloc[0:0].assign(article_id=pd.Series(dtype='Int64'))
+    fetched = articles_df[articles_df['url'].notna()]
+    url_to_id = dict(zip(fetched['url'], lookup_article_ids(conn, board, fetched)))
+    pushes = pushes_df.copy()
+    pushes['article_id'] = pushes['article_url'].map(url_to_id)
+    pushes = pushes[pushes['article_id'].notna()]
+    pushes['article_id'] = pushes['article_id'].astype('int64')
+    return pushes
+
+
+def replace_article_pushes(conn: sqlite3.Connection, board: str, pushes_df: pd.DataFrame,
+                           article_ids: list) -> int:
+    """
+    以本次抓到的推文取代 article_ids 這些文章既有的推文列，重複寫入同一批文章不會產生重複推文。
+    pushes_df 須含 article_id 欄位；沒有推文的文章也應列入 article_ids，以清除舊列。
+    """
+    push_table = board_table(board, '_pushes')
+    article_ids = [int(i) for i in article_ids]
+    rows = pushes_df.copy()
+    if not rows.empty:
+        rows['timestamp'] = _format_timestamps(rows['timestamp'])
+        rows = rows[rows['timestamp'] >= rolled_up_before(conn, board, pushes=True)]
+    column_list = ', '.join(PUSH_COLUMNS)
+    placeholders = ', '.join('?' for _ in PUSH_COLUMNS)
+    with conn:
+        for start in range(0, len(article_ids), 500):
+            chunk = article_ids[start:start + 500]
+            conn.execute(
+                f"DELETE FROM {push_table} WHERE article_id IN ({', '.join('?' for _ in chunk)})", chunk
+            )
+        if not rows.empty:
+            conn.executemany(
+                f"INSERT INTO {push_table} ({column_list}) VALUES ({placeholders})",
+                rows[PUSH_COLUMNS].astype(object).itertuples(index=False, name=None)
+            )
+    return len(rows)
+
+
+
+def store_article_pushes(conn: sqlite3.Connection, board: str, articles_df: pd.DataFrame,
+                         pushes_df: pd.DataFrame) -> int:
+    """
+    以本次抓到的推文取代 articles_df 中有 url 的文章（即確實抓取的文章）的推文；文章須已寫入。
+
+    返回:
+        寫入的推文數
+    """
+    if articles_df.empty or 'url' not in articles_df.columns:
+        return 0
+    fetched = articles_df[articles_df['url'].notna()]
+    pushes_df = resolve_push_article_ids(conn, board, fetched, pushes_df)
+    article_ids = lookup_article_ids(conn, board, fetched).dropna().tolist()
+    return replace_article_pushes(conn, board, pushes_df, article_ids)
+
+# --- 保留期限與壓縮 ---
+
+def _iter_day_partitions(conn: sqlite3.Connection, table: str, cutoff: str, max_partitions: int,
+                         condition: str = '1'):
+    """由舊到新列出早於 cutoff 的日分割區 (day_start, day_end)，最多 max_partitions 個。"""
+    for _ in range(max_partitions):
+        row = conn.execute(
+            f"SELECT MIN(timestamp) FROM {table} WHERE timestamp < ? AND {condition}", (cutoff,)
+        ).fetchone()
+        if row is None or row[0] is None:
+            return
+        day_start = row[0][:10]
+        day_end = (datetime.datetime.strptime(day_start, '%Y-%m-%d') + datetime.timedelta(days=1)).strftime(TIMESTAMP_FORMAT)
+        yield day_start, min(day_end, cutoff)
+
+
+def rolled_up_before(conn: sqlite3.Connection, board: str, pushes: bool = False) -> str:
+    """已彙總進每小時彙總表的時間上界（TIMESTAMP_FORMAT 字串）；尚未彙總過時為空字串。"""
+    column = 'pushes_rolled_up_before' if pushes else 'articles_rolled_up_before'
+    row = conn.execute(f"SELECT {column} FROM retention_state WHERE board = ?", (board,)).fetchone()
+    return row[0] if row else ''
+
+
+def _rollup_and_delete(conn: sqlite3.Connection, board: str, label: str, source: str, rollup: str,
+                       start: str, end: str) -> int:
+    """
+    將 [start, end) 的列彙總進每小時彙總表後刪除，並推進已彙總時間上界，三者在同一個交易內完成。
+    """
+    sums = ', '.join(f'COALESCE(SUM({emo}), 0)' for emo in EMOTIONS_NAMES)
+    sum_columns = ', '.join(f'{emo}_sum' for emo in EMOTIONS_NAMES)
+    updates = ', '.join(f'{emo}_sum = {emo}_sum + excluded.{emo}_sum' for emo in EMOTIONS_NAMES)
+    with conn:
+        conn.execute(
+            f"INSERT INTO {rollup} (hour, item_count, {sum_columns}) "
+            f"SELECT substr(timestamp, 1, 13) || ':00:00', COUNT(*), {sums} FROM {source} "
+            f"WHERE timestamp >= ? AND timestamp < ? GROUP BY 1 "
+            f"ON CONFLICT (hour) DO UPDATE SET item_count = item_count + excluded.item_count, {updates}",
+            (start, end)
+        )
+        deleted = conn.execute(
+            f"DELETE FROM {source} WHERE timestamp >= ? AND timestamp < ?", (start, end)
+        ).rowcount
+        column = f'{label}_rolled_up_before'
+        conn.execute(
+            f"INSERT INTO retention_state (board, {column}) VALUES (?, ?) "
+            f"ON CONFLICT (board) DO UPDATE SET {column} = MAX({column}, excluded.{column})",
+            (board, end)
+        )
+    return deleted
+
+
+def apply_retention(conn: sqlite3.Connection, board: str, content_days: int, score_days: int,
+                    max_partitions: int = 7, vacuum_pages: int = 500, now=None) -> dict:
+    """
+    套用看板的保留政策：
+
+    - 超過 content_days 的文章與推文：清除內文，只保留精簡的情感分數。
+    - 超過 score_days 的文章與推文：彙總進每小時彙總表後刪除。
+      已彙總的時間上界記錄在 retention_state，之後再寫入早於此時間的列會被略過，避免重複彙總。
+    - 最後增量回收最多 vacuum_pages 個空頁。
+
+    每次最多處理 max_partitions 個日分割區，讓長時間運行的部署每次呼叫的成本固定。
+
+    返回:
+        各步驟處理列數的統計字典
+    """
+    if score_days < content_days:
+        raise ValueError("score_days 不可小於 content_days")
+
+    now = now or datetime.datetime.now()
+    content_cutoff = (now - datetime.timedelta(days=content_days)).strftime(TIMESTAMP_FORMAT)
+    score_cutoff = (now - datetime.timedelta(days=score_days)).strftime(TIMESTAMP_FORMAT)
+    stats = {'rolled_up_articles': 0, 'rolled_up_pushes': 0, 'compacted_articles': 0, 'compacted_pushes': 0}
+
+    targets = [
+        (board_table(board), board_table(board, '_hourly'), 'content', 'articles'),
+        (board_table(board, '_pushes'), board_table(board, '_pushes_hourly'), 'text', 'pushes'),
+    ]
+    from search import index_articles, unindex_articles, remove_from_index
+    from lexicon import remove_article_terms
+
+    for source, rollup, text_column, label in targets:
+        for start, end in _iter_day_partitions(conn, source, score_cutoff, max_partitions):
+            if label == 'articles':
+                # 與刪除在同一個交易內提交
+                remove_from_index(conn, board, start, end)
+                remove_article_terms(conn, board, start, end)
+            stats[f'rolled_up_{label}'] += _rollup_and_delete(conn, board, label, source, rollup, start, end)
+
+        for start, end in _iter_day_partitions(conn, source, content_cutoff, max_partitions,
+                                               condition=f'{text_column} IS NOT NULL'):
+            compacted_ids = []
+            if label == 'articles':
+                # 內文清除後無法重新計分，不再需要詞典反向索引
+                remove_article_terms(conn, board, start, end)
+                compacted_ids = [row[0] for row in conn.execute(
+                    f"SELECT id FROM {source} WHERE timestamp >= ? AND timestamp < ? AND content IS NOT NULL",
+                    (start, end)
+                )]
+            with conn:
+                # 內文已清除的文章只保留標題索引
+                unindex_articles(conn, board, compacted_ids)
+                stats[f'compacted_{label}'] += conn.execute(
+                    f"UPDATE {source} SET {text_column} = NULL "
+                    f"WHERE timestamp >= ? AND timestamp < ? AND {text_column} IS NOT NULL",
+                    (start, end)
+                ).rowcount
+                index_articles(conn, board, compacted_ids)
+
+    if vacuum_pages > 0:
+        conn.execute(f"PRAGMA incremental_vacuum({int(vacuum_pages)})")
+    return stats
+
+
+def load_hourly_rollup(conn: sqlite3.Connection, board: str, start=None, end=None,
+                       pushes: bool = False) -> pd.DataFrame:
+    """讀取每小時彙總表，回傳以小時為索引、欄位為各情感平均分數的 DataFrame。"""
+    table = board_table(board, '_pushes_hourly' if pushes else '_hourly')
+    query = f"SELECT * FROM {table} WHERE hour >= ? AND hour < ? ORDER BY hour"
+    params = (
+        pd.to_datetime(start).strftime(TIMESTAMP_FORMAT) if start is not None else '',
+        pd.to_datetime(end).strftime(TIMESTAMP_FORMAT) if end is not None else '9999',
+    )
+    df = pd.read_sql(query, conn, params=params, parse_dates=['hour'])
+    if df.empty:
+        return pd.DataFrame(columns=EMOTIONS_NAMES)
+    hourly = pd.DataFrame(index=df['hour'].rename('timestamp'))
+    for emo in EMOTIONS_NAMES:
+        hourly[emo] = (df[f'{emo}_sum'] / df['item_count']).values
+    return hourly
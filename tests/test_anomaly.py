@@ -0,0 +1,147 @@
+# tests/test_anomaly.py
+
+import sqlite3
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from config import EMOTIONS_NAMES
+from anomaly import SpikeDetector, update_board_alerts, load_alerts
+from storage import ensure_board_schema, upsert_articles
+
+BOARD = 'Test'
+NOW = datetime.datetime(2026, 10, 19, 12, 30)
+
+
+def _detector():
+    return SpikeDetector(alpha=0.1, threshold=3.0, warmup=24, min_std=0.05, min_articles=3)
+
+
+def _articles(hour, count, anger=None, seed=0):
+    """某小時的 count 篇文章；anger 為 None 時分數為平穩的隨機雜訊。"""
+    rng = np.random.RandomState(seed)
+    rows = []
+    for i in range(count):
+        row = {'timestamp': hour + datetime.timedelta(minutes=i % 60, seconds=i // 60), 'title': f'標題{seed}-{i}',
+               'author': 'user', 'content': '內文', 'board': BOARD}
+        row.update({emo: float(rng.uniform(0.1, 0.3)) for emo in EMOTIONS_NAMES})
+        if anger is not None:
+            row['anger'] = anger
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def _write_hours(conn, first, last, count=5):
+    """寫入 NOW 之前第 first 到第 last 小時（含）的平穩資料。"""
+    current = pd.Timestamp(NOW).floor('h')
+    for back in range(first, last - 1, -1):
+        hour = current - pd.Timedelta(hours=back)
+        upsert_articles(conn, BOARD, _articles(hour, count, seed=back))
+
+
+def _hourly(conn):
+    from query import aggregate_emotions
+    return aggregate_emotions(conn, BOARD, group_by='hour', end=pd.Timestamp(NOW).floor('h'))
+
+
+def _alert_keys(alerts):
+    return sorted((a['emotion'], a['hour']) for a in alerts)
+
+
+@pytest.fixture
+def conn(tmp_path):
+    connection = sqlite3.connect(str(tmp_path / 'anomaly.db'))
+    ensure_board_schema(connection, BOARD)
+    yield connection
+    connection.close()
+
+
+def test_backfill_matches_hourly_updates(conn):
+    _write_hours(conn, 60, 1)
+    current = pd.Timestamp(NOW).floor('h')
+    upsert_articles(conn, BOARD, _articles(current - pd.Timedelta(hours=5), 40, anger=0.95, seed=99))
+    hourly = _hourly(conn)
+
+    vectorized, stepwise = _detector(), _detector()
+    backfilled = vectorized.backfill(BOARD, hourly)
+    updated = []
+    for hour, row in hourly.iterrows():
+        updated.extend(stepwise.update(BOARD, hour, row.to_dict(), int(row['article_count'])))
+
+    assert backfilled, '測試資料應產生至少一個警示'
+    assert _alert_keys(backfilled) == _alert_keys(updated)
+    for a, b in zip(sorted(backfilled, key=lambda x: (x['emotion'], x['hour'])),
+                    sorted(updated, key=lambda x: (x['emotion'], x['hour']))):
+        assert a['zscore'] == pytest.approx(b['zscore'])
+        assert a['baseline'] == pytest.approx(b['baseline'])
+    for key, state in vectorized.states.items():
+        other = stepwise.states[key]
+        assert (state.count, state.last_hour) == (other.count, other.last_hour)
+        assert state.mean == pytest.approx(other.mean)
+        assert state.var == pytest.approx(other.var, abs=1e-12)
+
+
+def test_late_rows_for_recent_hour_raise_alert(conn):
+    _write_hours(conn, 29, 1)
+    assert update_board_alerts(conn, BOARD, _detector(), now=NOW) == []
+    state_before = conn.execute("SELECT * FROM anomaly_state ORDER BY emotion").fetchall()
+
+    # 工作者較晚寫入的批次落在已處理過的小時
+    late_hour = pd.Timestamp(NOW).floor('h') - pd.Timedelta(hours=2)
+    upsert_articles(conn, BOARD, _articles(late_hour, 40, anger=0.95, seed=99))
+    alerts = update_board_alerts(conn, BOARD, _detector(), now=NOW)
+
+    assert [(a['emotion'], a['hour']) for a in alerts] == [('anger', late_hour.strftime('%Y-%m-%d %H:%M:%S'))]
+    # 最近的小時只暫時計算，固定的狀態不變
+    assert conn.execute("SELECT * FROM anomaly_state ORDER BY emotion").fetchall() == state_before
+    assert len(load_alerts(conn, BOARD)) == 1
+
+
+def test_repeated_runs_do_not_duplicate_alerts(conn):
+    _write_hours(conn, 29, 1)
+    late_hour = pd.Timestamp(NOW).floor('h') - pd.Timedelta(hours=2)
+    upsert_articles(conn, BOARD, _articles(late_hour, 40, anger=0.95, seed=99))
+
+    assert len(update_board_alerts(conn, BOARD, _detector(), now=NOW)) == 1
+    assert update_board_alerts(conn, BOARD, _detector(), now=NOW) == []
+    assert len(load_alerts(conn, BOARD)) == 1
+
+
+def test_incremental_runs_match_single_backfill(conn, tmp_path):
+    current = pd.Timestamp(NOW).floor('h')
+    spike_hour = current - pd.Timedelta(hours=8)
+    _write_hours(conn, 40, 12)
+    for step in range(11, -1, -1):
+        run_now = current - pd.Timedelta(hours=step)
+        _write_hours(conn, step + 1, step + 1)
+        if step == 6:
+            # 突增小時的文章在三小時後才補齊
+            upsert_articles(conn, BOARD, _articles(spike_hour, 40, anger=0.95, seed=99))
+        update_board_alerts(conn, BOARD, _detector(), now=run_now)
+
+    reference = sqlite3.connect(str(tmp_path / 'reference.db'))
+    ensure_board_schema(reference, BOARD)
+    _write_hours(reference, 40, 1)
+    upsert_articles(reference, BOARD, _articles(spike_hour, 40, anger=0.95, seed=99))
+    update_board_alerts(reference, BOARD, _detector(), now=current)
+
+    query = "SELECT emotion, hour, round(zscore, 9) FROM emotion_alerts ORDER BY emotion, hour"
+    state_query = "SELECT emotion, count, last_hour, round(mean, 9) FROM anomaly_state ORDER BY emotion"
+    assert conn.execute(query).fetchall() == reference.execute(query).fetchall()
+    assert conn.execute(state_query).fetchall() == reference.execute(state_query).fetchall()
+    assert [hour for _, hour, _ in conn.execute(query)] == [spike_hour.strftime('%Y-%m-%d %H:%M:%S')]
+    reference.close()
+
+
+def test_alert_withdrawn_when_hour_fills_in(conn):
+    _write_hours(conn, 29, 3)
+    late_hour = pd.Timestamp(NOW).floor('h') - pd.Timedelta(hours=2)
+    upsert_articles(conn, BOARD, _articles(late_hour, 3, anger=0.95, seed=99))
+    assert len(update_board_alerts(conn, BOARD, _detector(), now=NOW)) == 1
+
+    # 同一小時補進大量一般文章後，平均分數回到基準附近
+    upsert_articles(conn, BOARD, _articles(late_hour, 60, seed=98))
+    assert update_board_alerts(conn, BOARD, _detector(), now=NOW) == []
+    assert load_alerts(conn, BOARD).empty
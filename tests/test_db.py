@@ -0,0 +1,68 @@
+# tests/test_db.py
+
+import sqlite3
+
+import pytest
+
+from db import SQLiteDatabase
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = SQLiteDatabase(str(tmp_path / 'test.db'), pool_size=2)
+    database.write(lambda conn: conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, value TEXT UNIQUE)"))
+    yield database
+    database.close()
+
+
+def _count(db):
+    with db.connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM t").fetchone()[0]
+
+
+def test_write_returns_result_and_is_visible_to_readers(db):
+    assert db.write(lambda conn: conn.execute("INSERT INTO t (value) VALUES ('a')").lastrowid) == 1
+    assert _count(db) == 1
+
+
+def test_write_propagates_exception_and_rolls_back(db):
+    def insert_then_fail(conn):
+        conn.execute("INSERT INTO t (value) VALUES ('a')")
+        conn.execute("INSERT INTO t (value) VALUES ('a')")
+
+    with pytest.raises(sqlite3.IntegrityError):
+        db.write(insert_then_fail)
+    assert _count(db) == 0
+
+    # 寫入執行緒在例外後仍可繼續處理
+    assert db.executemany("INSERT INTO t (value) VALUES (?)", [('a',), ('b',)]) == 2
+    assert _count(db) == 2
+
+
+def test_submit_returns_future_with_exception(db):
+    future = db.submit(lambda conn: 1 / 0)
+    assert isinstance(future.exception(timeout=5), ZeroDivisionError)
+
+
+def test_connection_rolls_back_uncommitted_reads(db):
+    with db.connection() as conn:
+        conn.execute("INSERT INTO t (value) VALUES ('x')")
+        assert conn.in_transaction
+    assert _count(db) == 0
+
+
+def test_connection_times_out_when_pool_is_exhausted(db):
+    with db.connection(), db.connection():
+        with pytest.raises(TimeoutError):
+            with db.connection(timeout=0.05):
+                pass
+    assert _count(db) == 0
+
+
+def test_closed_database_rejects_use(db):
+    db.close()
+    with pytest.raises(RuntimeError):
+        db.write(lambda conn: None)
+    with pytest.raises(RuntimeError):
+        with db.connection():
+            pass
@@ -0,0 +1,129 @@
+# tests/test_dedup.py
+
+import sqlite3
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from config import EMOTIONS_NAMES, DEDUP_WINDOW_HOURS
+from dedup import FingerprintIndex, strip_quoted_text
+from lexicon import Lexicon
+from scoring_backends import ScoringBackend
+from sentiment_analyzer import analyze_sentiment_batch, load_repost_history
+from storage import ensure_board_schema, upsert_articles
+
+BOARD = 'Test'
+START = datetime.datetime(2026, 10, 18, 10)
+ORIGINAL = '央行今天宣布升息半碼，市場普遍認為房價短期內會受到壓抑，但薪水沒有跟著漲，年輕人買房更加困難了。'
+OTHER = '颱風明天晚上可能登陸，氣象局提醒民眾做好防颱準備，山區要注意土石流與落石，請大家出門小心。'
+QUOTED_REPLY = '※ 引述《user0 (暱稱)》之銘言：\n: 原文第一行\n：\n： 原文第二行\n\n我覺得這樣很好\n'
+
+
+class CountingBackend(ScoringBackend):
+    """依文本長度給分並記錄送來計分的文本。"""
+
+    name = 'counting'
+
+    def __init__(self):
+        super().__init__()
+        self.texts = []
+
+    def score(self, texts: list) -> np.ndarray:
+        self.texts.extend(texts)
+        return np.array([[len(text) / 100.0] * len(EMOTIONS_NAMES) for text in texts], dtype=np.float32)
+
+
+def _articles(contents, start=START, title='標題'):
+    return pd.DataFrame([
+        {'timestamp': start + datetime.timedelta(minutes=i), 'title': f'{title}{i}', 'author': f'user{i}',
+         'content': content, 'board': BOARD}
+        for i, content in enumerate(contents)
+    ])
+
+
+def test_strip_quoted_text_keeps_only_new_content():
+    assert strip_quoted_text(QUOTED_REPLY) == '我覺得這樣很好'
+    assert strip_quoted_text('第一行\n第二行: 不是引文') == '第一行\n第二行: 不是引文'
+    assert strip_quoted_text(None) == ''
+    assert strip_quoted_text('') == ''
+
+
+def test_fingerprint_index_matches_near_duplicates():
+    index = FingerprintIndex(threshold=0.8)
+    assert index.find_or_add('a', ORIGINAL) is None
+    assert index.find_or_add('b', ORIGINAL + '（轉錄）') == 'a'
+    assert index.find_or_add('c', OTHER) is None
+    assert index.find_or_add('d', '') is None
+    # 重複的文章不加入索引，空文本沒有簽章
+    assert len(index) == 2
+
+
+def test_fingerprint_index_evicts_articles_outside_window():
+    index = FingerprintIndex(window=datetime.timedelta(hours=48))
+    assert index.find_or_add('a', ORIGINAL, START) is None
+    assert index.find_or_add('b', ORIGINAL, START + datetime.timedelta(hours=47)) == 'a'
+    assert index.find_or_add('c', ORIGINAL, START + datetime.timedelta(hours=49)) is None
+    assert len(index) == 1
+
+
+def test_batch_reposts_reuse_scores_of_the_original():
+    backend = CountingBackend()
+    df = analyze_sentiment_batch(_articles([ORIGINAL, OTHER, ORIGINAL + '（轉錄）']), backend, show_progress=False)
+
+    assert backend.texts == [ORIGINAL, OTHER]
+    assert df['is_repost'].tolist() == [False, False, True]
+    assert df.loc[2, EMOTIONS_NAMES].tolist() == df.loc[0, EMOTIONS_NAMES].tolist()
+
+
+def test_quoted_reply_is_scored_on_its_own_text():
+    backend = CountingBackend()
+    reply = '※ 引述《user0 (暱稱)》之銘言：\n' + ''.join(f': {line}\n' for line in ORIGINAL.split('，')) + '\n' + OTHER
+    df = analyze_sentiment_batch(_articles([ORIGINAL, reply]), backend, show_progress=False)
+
+    assert backend.texts == [ORIGINAL, OTHER]
+    assert not df['is_repost'].any()
+
+
+@pytest.fixture
+def conn(tmp_path):
+    connection = sqlite3.connect(str(tmp_path / 'dedup.db'))
+    ensure_board_schema(connection, BOARD)
+    lexicon = Lexicon({emo: [] for emo in EMOTIONS_NAMES}, [], {}, version='test')
+    stored = _articles([ORIGINAL, OTHER], title='舊標題').assign(**{emo: 0.25 for emo in EMOTIONS_NAMES})
+    upsert_articles(connection, BOARD, stored, lexicon)
+    yield connection
+    connection.close()
+
+
+def test_repost_of_stored_article_reuses_its_scores(conn):
+    batch = _articles([ORIGINAL + '（轉錄）', '完全不同的新文章內容，講的是球賽結果與球員表現，沒有重複。'],
+                      start=START + datetime.timedelta(hours=3))
+    history = load_repost_history(conn, BOARD, batch)
+    assert len(history) == 2
+
+    backend = CountingBackend()
+    df = analyze_sentiment_batch(batch, backend, show_progress=False, history=history)
+    assert df['is_repost'].tolist() == [True, False]
+    assert df.loc[0, EMOTIONS_NAMES].tolist() == pytest.approx([0.25] * len(EMOTIONS_NAMES))
+    assert backend.texts == [batch.loc[1, 'content']]
+
+
+def test_refetched_article_does_not_match_its_stored_copy(conn):
+    # 重新抓到已寫入的文章（相同時間、標題、作者）時應重新計分，而不是被當成自己的轉貼
+    batch = _articles([ORIGINAL + '（已編輯）'], title='舊標題')
+    backend = CountingBackend()
+    df = analyze_sentiment_batch(batch, backend, show_progress=False, history=load_repost_history(conn, BOARD, batch))
+
+    assert not df['is_repost'].any()
+    assert backend.texts == [batch.loc[0, 'content']]
+
+
+def test_stored_articles_outside_window_are_ignored(conn):
+    batch = _articles([ORIGINAL + '（轉錄）'], start=START + datetime.timedelta(hours=DEDUP_WINDOW_HOURS + 1))
+    history = load_repost_history(conn, BOARD, batch)
+    assert history.empty
+
+    df = analyze_sentiment_batch(batch, CountingBackend(), show_progress=False, history=history)
+    assert not df['is_repost'].any()
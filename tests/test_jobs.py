@@ -0,0 +1,125 @@
+# tests/test_jobs.py
+
+import sqlite3
+
+import pytest
+
+import jobs
+from jobs import ensure_jobs_schema, enqueue, enqueue_page_ranges, claim, heartbeat, complete, fail, job_counts
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可手動推進的時間，取代 jobs 模組使用的 time.time()。"""
+    class Clock:
+        now = 1_000_000.0
+
+        def advance(self, seconds):
+            self.now += seconds
+
+    fake = Clock()
+    monkeypatch.setattr(jobs.time, 'time', lambda: fake.now)
+    return fake
+
+
+@pytest.fixture
+def conn(tmp_path):
+    connection = sqlite3.connect(str(tmp_path / 'jobs.db'))
+    ensure_jobs_schema(connection)
+    yield connection
+    connection.close()
+
+
+def _status(conn, job):
+    return conn.execute("SELECT status, attempts FROM ingest_jobs WHERE id = ?", (job.id,)).fetchone()
+
+
+def test_enqueue_is_deduplicated_until_finished(conn, clock):
+    assert enqueue(conn, 'Test', 'pages', {'first': 1, 'last': 2}) == 1
+    assert enqueue(conn, 'Test', 'pages', {'last': 2, 'first': 1}) == 0
+
+    job = claim(conn, 'w1', lease_seconds=60)
+    assert enqueue(conn, 'Test', 'pages', {'first': 1, 'last': 2}) == 0  # 執行中
+    assert complete(conn, job, 'w1')
+    assert enqueue(conn, 'Test', 'pages', {'first': 1, 'last': 2}) == 1  # 完成後可重新排入
+    assert _status(conn, job) == ('pending', 0)
+
+
+def test_enqueue_rejects_unknown_kind_and_board(conn):
+    with pytest.raises(ValueError):
+        enqueue(conn, 'Test', 'unknown', {})
+    with pytest.raises(ValueError):
+        enqueue(conn, 'Test; DROP TABLE x', 'pages', {'first': 1, 'last': 1})
+
+
+def test_enqueue_page_ranges_splits_range(conn, clock):
+    assert enqueue_page_ranges(conn, 'Test', 10, 14, pages_per_job=2) == 3
+    payloads = []
+    while (job := claim(conn, 'w1', lease_seconds=60)) is not None:
+        payloads.append(job.payload)
+    assert payloads == [{'first': 10, 'last': 11}, {'first': 12, 'last': 13}, {'first': 14, 'last': 14}]
+
+
+def test_claim_hands_out_each_job_once(conn, clock):
+    enqueue(conn, 'Test', 'pages', {'first': 1, 'last': 1})
+    job = claim(conn, 'w1', lease_seconds=60)
+    assert job.attempts == 1 and job.payload == {'first': 1, 'last': 1}
+    assert claim(conn, 'w2', lease_seconds=60) is None
+    assert _status(conn, job) == ('running', 1)
+
+
+def test_claim_filters_by_board(conn, clock):
+    enqueue(conn, 'Other', 'pages', {'first': 1, 'last': 1})
+    assert claim(conn, 'w1', lease_seconds=60, boards=['Test']) is None
+    assert claim(conn, 'w1', lease_seconds=60, boards=['Test', 'Other']).board == 'Other'
+
+
+def test_expired_lease_is_reclaimed_and_stale_owner_is_rejected(conn, clock):
+    enqueue(conn, 'Test', 'pages', {'first': 1, 'last': 1})
+    first = claim(conn, 'w1', lease_seconds=60)
+
+    clock.advance(30)
+    assert heartbeat(conn, first, 'w1', lease_seconds=60)
+    clock.advance(61)
+    second = claim(conn, 'w2', lease_seconds=60)
+    assert second.id == first.id and second.attempts == 2
+
+    # 原工作者的租約已被取走
+    assert not heartbeat(conn, first, 'w1', lease_seconds=60)
+    assert not complete(conn, first, 'w1')
+    assert fail(conn, first, 'w1', 'boom', retry_delay=10) is None
+    assert complete(conn, second, 'w2')
+    assert _status(conn, second) == ('done', 2)
+
+
+def test_expired_lease_without_attempts_left_is_failed(conn, clock):
+    enqueue(conn, 'Test', 'pages', {'first': 1, 'last': 1}, max_attempts=1)
+    job = claim(conn, 'w1', lease_seconds=60)
+    clock.advance(61)
+    assert claim(conn, 'w2', lease_seconds=60) is None
+    assert conn.execute("SELECT status, last_error FROM ingest_jobs WHERE id = ?", (job.id,)).fetchone() == \
+        ('failed', '租約過期')
+
+
+def test_fail_retries_with_exponential_backoff_then_gives_up(conn, clock):
+    enqueue(conn, 'Test', 'pages', {'first': 1, 'last': 1}, max_attempts=3)
+
+    job = claim(conn, 'w1', lease_seconds=60)
+    assert fail(conn, job, 'w1', 'HTTP 503', retry_delay=10) == 'pending'
+    clock.advance(9)
+    assert claim(conn, 'w1', lease_seconds=60) is None
+    clock.advance(1)
+    job = claim(conn, 'w1', lease_seconds=60)
+    assert job.attempts == 2
+
+    assert fail(conn, job, 'w1', 'HTTP 503', retry_delay=10) == 'pending'
+    clock.advance(19)
+    assert claim(conn, 'w1', lease_seconds=60) is None
+    clock.advance(1)
+    job = claim(conn, 'w1', lease_seconds=60)
+    assert job.attempts == 3
+
+    assert fail(conn, job, 'w1', 'HTTP 503', retry_delay=10) == 'failed'
+    clock.advance(3600)
+    assert claim(conn, 'w1', lease_seconds=60) is None
+    assert job_counts(conn) == {('Test', 'failed'): 1}
@@ -0,0 +1,130 @@
+# tests/test_lexicon.py
+
+import sqlite3
+import datetime
+
+import pandas as pd
+import pytest
+
+from config import EMOTIONS_NAMES
+from lexicon import Lexicon, sync_board_lexicon, changed_terms
+from sentiment_analyzer import analyze_article_texts
+from storage import ensure_board_schema, upsert_articles, board_table
+
+BOARD = 'Test'
+CONTENTS = ['今天真的很開心', '我非常生氣', '天氣不錯', '好爽啊', '生氣之後又開心了']
+
+
+def _lexicon(version='v1', **emotions):
+    emotion_lexicon = {emo: [] for emo in EMOTIONS_NAMES}
+    emotion_lexicon.update(emotions)
+    return Lexicon(emotion_lexicon, ['不'], {'high': ['很'], 'extreme': ['非常']}, version=version)
+
+
+BASE = _lexicon(joy=['開心'], anger=['生氣'])
+
+
+def _scores(lexicon):
+    return analyze_article_texts(CONTENTS, lexicon.emotion_lexicon, lexicon.negation_words, lexicon.degree_adverbs)
+
+
+@pytest.fixture
+def conn(tmp_path):
+    connection = sqlite3.connect(str(tmp_path / 'lexicon.db'))
+    ensure_board_schema(connection, BOARD)
+    start = datetime.datetime(2026, 10, 18, 10)
+    articles = pd.DataFrame([
+        {'timestamp': start + datetime.timedelta(minutes=i), 'title': f'標題{i}', 'author': 'user',
+         'content': content, 'board': BOARD}
+        for i, content in enumerate(CONTENTS)
+    ])
+    articles[EMOTIONS_NAMES] = _scores(BASE)
+    upsert_articles(connection, BOARD, articles, BASE)
+    assert sync_board_lexicon(connection, BOARD, BASE) == 0  # 第一次同步只建立反向索引
+    yield connection
+    connection.close()
+
+
+def _stored_scores(conn):
+    return conn.execute(f"SELECT {', '.join(EMOTIONS_NAMES)} FROM {board_table(BOARD)} ORDER BY id").fetchall()
+
+
+def _assert_consistent(conn, lexicon):
+    """選擇性重新計分的結果應與以新詞典重新計分全部文章相同。"""
+    assert _stored_scores(conn) == pytest.approx([tuple(row) for row in _scores(lexicon)])
+
+
+def _state(conn):
+    return conn.execute("SELECT version FROM lexicon_state WHERE board = ?", (BOARD,)).fetchone()[0]
+
+
+def test_unchanged_content_is_not_rescored(conn):
+    assert sync_board_lexicon(conn, BOARD, _lexicon(version='relabelled', joy=['開心'], anger=['生氣'])) == 0
+
+
+def test_added_single_character_term_without_version_bump(conn):
+    # 詞典檔的 version 沒有更新，仍依內容偵測到變更
+    updated = _lexicon(joy=['開心', '爽'], anger=['生氣'])
+    assert updated.version == BASE.version and updated.content_hash != BASE.content_hash
+    assert changed_terms(BASE, updated) == ({'爽'}, set())
+
+    assert sync_board_lexicon(conn, BOARD, updated) == 1
+    _assert_consistent(conn, updated)
+    assert sync_board_lexicon(conn, BOARD, updated) == 0
+
+
+def test_removed_term_rescores_only_articles_containing_it(conn):
+    updated = _lexicon(version='v2', joy=['開心'])
+    assert sync_board_lexicon(conn, BOARD, updated) == 2
+    _assert_consistent(conn, updated)
+    assert _state(conn) == 'v2'
+
+
+def test_term_moved_to_another_emotion(conn):
+    updated = _lexicon(version='v2', trust=['開心'], anger=['生氣'])
+    assert changed_terms(BASE, updated) == (set(), {'開心'})
+    assert sync_board_lexicon(conn, BOARD, updated) == 2
+    _assert_consistent(conn, updated)
+
+
+def test_degree_adverb_change(conn):
+    updated = Lexicon(BASE.emotion_lexicon, BASE.negation_words, {'high': ['很'], 'low': ['非常']}, version='v2')
+    assert sync_board_lexicon(conn, BOARD, updated) == 1
+    _assert_consistent(conn, updated)
+
+
+def test_stale_lexicon_does_not_move_board_back(conn):
+    newer = _lexicon(version='v2', joy=['開心', '爽'], anger=['生氣'])
+    newer.revision = 200.0
+    assert sync_board_lexicon(conn, BOARD, newer) == 1
+
+    # 另一個行程尚未重新載入詞典，仍以舊詞典計分並寫入一篇新文章
+    stale = _lexicon(version='v1', joy=['開心'], anger=['生氣'])
+    stale.revision = 100.0
+    article = pd.DataFrame([{'timestamp': datetime.datetime(2026, 10, 18, 12), 'title': '新文章', 'author': 'user',
+                             'content': '爽啦', 'board': BOARD}])
+    article[EMOTIONS_NAMES] = analyze_article_texts(['爽啦'], stale.emotion_lexicon, stale.negation_words,
+                                                    stale.degree_adverbs)
+    upsert_articles(conn, BOARD, article, stale)
+    article_id = conn.execute(f"SELECT id FROM {board_table(BOARD)} WHERE title = '新文章'").fetchone()[0]
+
+    assert sync_board_lexicon(conn, BOARD, stale, [article_id]) == 1
+    assert _state(conn) == 'v2'
+    joy = conn.execute(f"SELECT joy FROM {board_table(BOARD)} WHERE id = ?", (article_id,)).fetchone()[0]
+    expected = analyze_article_texts(['爽啦'], newer.emotion_lexicon, newer.negation_words, newer.degree_adverbs)
+    assert joy == pytest.approx(float(expected[0, EMOTIONS_NAMES.index('joy')]))
+    # 其他文章維持以較新的詞典計分
+    assert _stored_scores(conn)[:len(CONTENTS)] == pytest.approx([tuple(row) for row in _scores(newer)])
+
+
+def test_lexicon_state_gains_revision_column(tmp_path):
+    connection = sqlite3.connect(str(tmp_path / 'legacy.db'))
+    ensure_board_schema(connection, BOARD)
+    connection.execute("DROP TABLE IF EXISTS lexicon_state")
+    connection.execute("CREATE TABLE lexicon_state (board TEXT PRIMARY KEY, version TEXT NOT NULL, data TEXT NOT NULL)")
+    connection.execute("INSERT INTO lexicon_state VALUES (?, ?, ?)", (BOARD, BASE.version, BASE.to_json()))
+    updated = _lexicon(version='v2', joy=['開心'])
+    updated.revision = 1.0
+    assert sync_board_lexicon(connection, BOARD, updated) == 0  # 看板沒有文章
+    assert connection.execute("SELECT version, revision FROM lexicon_state").fetchone() == ('v2', 1.0)
+    connection.close()
@@ -0,0 +1,69 @@
+# tests/test_query.py
+
+import sqlite3
+import datetime
+
+import pandas as pd
+import pytest
+
+from config import EMOTIONS_NAMES
+from lexicon import Lexicon
+from storage import ensure_board_schema, upsert_articles
+from query import query_articles, iter_articles
+
+BOARD = 'Test'
+LEXICON = Lexicon({emo: [] for emo in EMOTIONS_NAMES}, [], {}, version='test')
+START = datetime.datetime(2026, 10, 18, 10)
+
+
+@pytest.fixture
+def conn(tmp_path):
+    connection = sqlite3.connect(str(tmp_path / 'query.db'))
+    ensure_board_schema(connection, BOARD)
+    # 每兩篇同一時間，分頁邊界會落在相同 timestamp 的文章之間
+    upsert_articles(connection, BOARD, pd.DataFrame([
+        {'timestamp': START + datetime.timedelta(minutes=i // 2), 'title': f'標題{i}', 'author': f'user{i % 3}',
+         'content': f'內文{i}', 'board': BOARD, **{emo: i / 10 for emo in EMOTIONS_NAMES}}
+        for i in range(11)
+    ]), LEXICON)
+    yield connection
+    connection.close()
+
+
+def _all_pages(conn, page_size, **kwargs):
+    pages, cursor = [], None
+    while True:
+        page, cursor = query_articles(conn, BOARD, page_size=page_size, cursor=cursor, **kwargs)
+        pages.append(page)
+        if cursor is None:
+            return pages
+
+
+@pytest.mark.parametrize('page_size', [1, 2, 3, 4, 11, 50])
+def test_keyset_pages_cover_every_article_once_in_order(conn, page_size):
+    pages = _all_pages(conn, page_size, columns=['title'])
+    assert all(len(page) == page_size for page in pages[:-1])
+    articles = pd.concat(pages, ignore_index=True)
+    assert articles['title'].tolist() == [f'標題{i}' for i in range(11)]
+    assert list(articles.columns) == ['id', 'timestamp', 'title']
+    assert articles['timestamp'].is_monotonic_increasing
+
+
+def test_keyset_pages_respect_filters(conn):
+    pages = _all_pages(conn, 2, author='user1', start=START + datetime.timedelta(minutes=1))
+    assert pd.concat(pages)['title'].tolist() == ['標題4', '標題7', '標題10']
+
+
+def test_iter_articles_matches_query_articles(conn):
+    streamed = pd.concat(iter_articles(conn, BOARD, columns=['title', 'joy'], chunk_size=4), ignore_index=True)
+    paged = pd.concat(_all_pages(conn, 4, columns=['title', 'joy']), ignore_index=True)
+    assert streamed['title'].tolist() == paged['title'].tolist()
+    assert streamed['joy'].tolist() == paged['joy'].tolist()
+
+
+@pytest.mark.parametrize('columns', [['title', 'title; DROP TABLE x'], ['nonexistent']])
+def test_unknown_columns_are_rejected(conn, columns):
+    with pytest.raises(ValueError):
+        query_articles(conn, BOARD, columns=columns)
+    with pytest.raises(ValueError):
+        next(iter_articles(conn, BOARD, columns=columns))
@@ -0,0 +1,42 @@
+# tests/test_scoring_backends.py
+
+import numpy as np
+import pytest
+
+import sentiment_analyzer
+from config import EMOTIONS_NAMES
+from scoring_backends import LexiconBackend
+
+TEXTS = ['真的非常生氣', '不信任你', '今天很開心', '', '今天很開心', '這部電影非常好看，但結局讓人很失望又難過' * 3]
+
+
+def _reference(text):
+    scores = sentiment_analyzer.analyze_emotion_types(
+        text, sentiment_analyzer.emotion_lexicon, sentiment_analyzer.negation_words,
+        sentiment_analyzer.degree_adverbs
+    )
+    return [float(scores[emo]) for emo in EMOTIONS_NAMES]
+
+
+@pytest.fixture(autouse=True)
+def builtin_lexicon(monkeypatch):
+    # 不受專案目錄中 lexicon.json 的影響
+    from lexicon import builtin_lexicon
+    monkeypatch.setattr(sentiment_analyzer, 'get_active_lexicon', builtin_lexicon)
+
+
+def test_lexicon_backend_matches_per_article_analysis():
+    scores = LexiconBackend().score(TEXTS)
+    assert scores.shape == (len(TEXTS), len(EMOTIONS_NAMES))
+    for text, row in zip(TEXTS, scores):
+        assert row.tolist() == pytest.approx(_reference(text))
+
+
+def test_short_text_lookup_is_only_used_up_to_max_chars():
+    # 直接查表會切出程度副詞與情感詞，與 SnowNLP 斷詞的結果不同
+    text = '真的非常生氣'
+    anger = EMOTIONS_NAMES.index('anger')
+    assert sentiment_analyzer.analyze_short_texts([text])[0, anger] == 1.0
+    assert sentiment_analyzer.analyze_short_texts([text], max_chars=0)[0].tolist() == pytest.approx(_reference(text))
+    assert np.array_equal(sentiment_analyzer.analyze_article_texts([text]),
+                          sentiment_analyzer.analyze_short_texts([text], max_chars=0))
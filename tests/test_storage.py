@@ -0,0 +1,173 @@
+# tests/test_storage.py
+
+import sqlite3
+import datetime
+
+import pandas as pd
+import pytest
+
+from config import EMOTIONS_NAMES
+from lexicon import Lexicon
+from search import search_articles, ensure_fts_schema, fts_table, to_bigrams
+from storage import (
+    ensure_board_schema, upsert_articles, lookup_article_ids, store_article_pushes, apply_retention,
+    board_table
+)
+
+BOARD = 'Test'
+LEXICON = Lexicon({emo: [] for emo in EMOTIONS_NAMES} | {'joy': ['開心']}, ['不'], {'high': ['很']}, version='test')
+
+
+@pytest.fixture
+def conn(tmp_path):
+    connection = sqlite3.connect(str(tmp_path / 'storage.db'))
+    ensure_board_schema(connection, BOARD)
+    yield connection
+    connection.close()
+
+
+def _articles(start, count, content='今天很開心'):
+    return pd.DataFrame([
+        {'timestamp': start + datetime.timedelta(minutes=i), 'title': f'標題{i}', 'author': f'user{i}',
+         'content': f'{content} {i}', 'board': BOARD, 'url': f'https://www.ptt.cc/bbs/{BOARD}/M.{i}.html',
+         'is_repost': False, **{emo: 0.5 for emo in EMOTIONS_NAMES}}
+        for i in range(count)
+    ])
+
+
+def _pushes(articles, per_article):
+    return pd.DataFrame([
+        {'article_url': url, 'timestamp': timestamp, 'tag': '推', 'user': f'p{j}', 'text': '推',
+         **{emo: 0.0 for emo in EMOTIONS_NAMES}}
+        for url, timestamp in zip(articles['url'], articles['timestamp'])
+        for j in range(per_article)
+    ])
+
+
+def _count(conn, table):
+    return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_upsert_articles_is_idempotent(conn):
+    articles = _articles(datetime.datetime(2026, 10, 18, 10), 5)
+    assert upsert_articles(conn, BOARD, articles, LEXICON) == 5
+    ids = lookup_article_ids(conn, BOARD, articles).tolist()
+
+    assert upsert_articles(conn, BOARD, articles, LEXICON) == 5
+    assert _count(conn, board_table(BOARD)) == 5
+    assert lookup_article_ids(conn, BOARD, articles).tolist() == ids
+    assert len(search_articles(conn, BOARD, '開心')) == 5
+
+
+def test_upsert_articles_updates_in_place(conn):
+    articles = _articles(datetime.datetime(2026, 10, 18, 10), 3)
+    upsert_articles(conn, BOARD, articles, LEXICON)
+    ids = lookup_article_ids(conn, BOARD, articles).tolist()
+
+    changed = articles.copy()
+    changed.loc[0, 'content'] = '更新後的內文'
+    changed.loc[1, 'content'] = None  # 沒有內文時保留原本的內文
+    changed['joy'] = 0.9
+    upsert_articles(conn, BOARD, changed, LEXICON)
+
+    assert lookup_article_ids(conn, BOARD, changed).tolist() == ids
+    rows = conn.execute(f"SELECT content, joy FROM {board_table(BOARD)} ORDER BY id").fetchall()
+    assert rows == [('更新後的內文', 0.9), ('今天很開心 1', 0.9), ('今天很開心 2', 0.9)]
+    assert search_articles(conn, BOARD, '更新後')['title'].tolist() == ['標題0']
+    assert len(search_articles(conn, BOARD, '開心')) == 2
+
+
+def test_store_article_pushes_replaces_pushes_of_fetched_articles(conn):
+    articles = _articles(datetime.datetime(2026, 10, 18, 10), 3)
+    upsert_articles(conn, BOARD, articles, LEXICON)
+    push_table = board_table(BOARD, '_pushes')
+
+    assert store_article_pushes(conn, BOARD, articles, _pushes(articles, 2)) == 6
+    assert store_article_pushes(conn, BOARD, articles, _pushes(articles, 2)) == 6
+    assert _count(conn, push_table) == 6
+
+    # 只重新抓到第一篇，且推文已被刪光：只清除第一篇的推文
+    refetched = articles.iloc[[0]]
+    assert store_article_pushes(conn, BOARD, refetched, _pushes(refetched, 0)) == 0
+    ids = lookup_article_ids(conn, BOARD, articles).astype(int).tolist()
+    counts = dict(conn.execute(f"SELECT article_id, COUNT(*) FROM {push_table} GROUP BY article_id").fetchall())
+    assert counts == {ids[1]: 2, ids[2]: 2}
+
+
+def test_store_article_pushes_ignores_articles_without_url(conn):
+    articles = _articles(datetime.datetime(2026, 10, 18, 10), 2).drop(columns=['url'])
+    upsert_articles(conn, BOARD, articles, LEXICON)
+    assert store_article_pushes(conn, BOARD, articles, pd.DataFrame()) == 0
+
+
+def test_rolled_up_articles_are_not_reinserted(conn):
+    now = datetime.datetime(2026, 10, 18, 12)
+    old = _articles(now - datetime.timedelta(days=100), 3)
+    upsert_articles(conn, BOARD, old, LEXICON)
+    stats = apply_retention(conn, BOARD, content_days=14, score_days=90, now=now)
+    assert stats['rolled_up_articles'] == 3
+
+    assert upsert_articles(conn, BOARD, old, LEXICON) == 0
+    apply_retention(conn, BOARD, content_days=14, score_days=90, now=now)
+    assert _count(conn, board_table(BOARD)) == 0
+    assert conn.execute(f"SELECT SUM(item_count) FROM {board_table(BOARD, '_hourly')}").fetchone()[0] == 3
+
+
+def _index_terms(conn, table):
+    conn.execute(f"CREATE VIRTUAL TABLE temp.vocab USING fts5vocab('main', '{table}', 'instance')")
+    terms = conn.execute("SELECT term, doc, col, offset FROM temp.vocab ORDER BY 1, 2, 3, 4").fetchall()
+    conn.execute("DROP TABLE temp.vocab")
+    return terms
+
+
+def _assert_index_matches_articles(conn):
+    """contentless 索引的內容應與依文章表目前的標題與內文重新建立的索引相同。"""
+    conn.execute("CREATE TABLE expected_fts_source AS SELECT id, title, content FROM " + board_table(BOARD))
+    conn.execute("CREATE VIRTUAL TABLE expected_fts USING fts5(title, content, content='', tokenize='unicode61')")
+    conn.executemany(
+        "INSERT INTO expected_fts (rowid, title, content) VALUES (?, ?, ?)",
+        [(row_id, ' '.join(to_bigrams(title)), ' '.join(to_bigrams(content)))
+         for row_id, title, content in conn.execute("SELECT * FROM expected_fts_source")]
+    )
+    try:
+        assert _index_terms(conn, f'ptt_{BOARD}_fts') == _index_terms(conn, 'expected_fts')
+    finally:
+        conn.execute("DROP TABLE expected_fts")
+        conn.execute("DROP TABLE expected_fts_source")
+        conn.commit()
+
+
+def test_contentless_index_follows_updates_and_retention(conn):
+    now = datetime.datetime(2026, 10, 18, 12)
+    old = _articles(now - datetime.timedelta(days=100), 2, content='舊文章很開心')
+    compacted = _articles(now - datetime.timedelta(days=20), 3, content='即將清除的內文')
+    recent = _articles(now - datetime.timedelta(days=1), 3)
+    compacted['title'] += '清除'
+    for articles in (old, compacted, recent):
+        upsert_articles(conn, BOARD, articles, LEXICON)
+    _assert_index_matches_articles(conn)
+
+    changed = recent.copy()
+    changed.loc[0, 'content'] = '更新後的內文'
+    upsert_articles(conn, BOARD, changed, LEXICON)
+    _assert_index_matches_articles(conn)
+
+    apply_retention(conn, BOARD, content_days=14, score_days=90, now=now)
+    _assert_index_matches_articles(conn)
+    assert search_articles(conn, BOARD, '清除', columns=('content',)).empty
+    assert len(search_articles(conn, BOARD, '清除', columns=('title',))) == 3
+    assert search_articles(conn, BOARD, '舊文章').empty
+    assert search_articles(conn, BOARD, '更新後')['title'].tolist() == ['標題0']
+
+
+def test_content_bearing_index_is_rebuilt_as_contentless(conn):
+    upsert_articles(conn, BOARD, _articles(datetime.datetime(2026, 10, 18, 10), 3), LEXICON)
+    conn.execute(f"DROP TABLE {fts_table(BOARD)}")
+    conn.execute(f"CREATE VIRTUAL TABLE {fts_table(BOARD)} USING fts5(title, content, tokenize='unicode61')")
+    conn.commit()
+
+    ensure_fts_schema(conn, BOARD)
+    sql = conn.execute("SELECT sql FROM sqlite_master WHERE name = ?", (f'ptt_{BOARD}_fts',)).fetchone()[0]
+    assert "content=''" in sql
+    _assert_index_matches_articles(conn)
+    assert len(search_articles(conn, BOARD, '開心')) == 3
@@ -0,0 +1,253 @@
+# worker.py
+"""
+分散式擷取工作者：從資料庫中的工作佇列（jobs.py）認領工作，爬取、解析、計分並寫入文章與推文。
+
+    python worker.py enqueue Gossiping --pages 10 --pages-per-job 2   # 排入最新 10 頁，每 2 頁一個工作
+    python worker.py enqueue Gossiping --first 39000 --last 39010    # 排入指定頁碼範圍
+    python worker.py run --processes 4                               # 在本機啟動 4 個工作者
+    python worker.py run --boards Gossiping Stock --once             # 只處理指定看板，佇列清空後結束
+    python worker.py status
+
+列表頁工作（'pages'）只解析列表頁，再把文章展開成文章批次工作（'articles'），
+因此一段頁碼範圍的文章可以由多個工作者平行抓取。文章以 upsert 寫入、推文以整篇取代，
+工作重試或租約過期後被其他工作者重做都不會產生重複資料。
+每個文章批次寫入後執行與儀表板相同的看板維護（保留政策、詞典同步、突增偵測，見 maintenance.py）。
+"""
+
+import os
+import sys
+import time
+import uuid
+import socket
+import argparse
+import multiprocessing
+
+import pandas as pd
+
+from config import (
+    DB_POOL_SIZE, INGEST_LEASE_SECONDS, INGEST_MAX_ATTEMPTS, INGEST_RETRY_DELAY_SECONDS,
+    INGEST_ARTICLE_BATCH_SIZE, INGEST_REQUEST_DELAY
+)
+from data_fetcher import create_session, parse_index_page, index_page_url, latest_index_page, fetch_article
+from db import get_database
+from jobs import ensure_jobs_schema, enqueue, enqueue_page_ranges, claim, heartbeat, complete, fail, job_counts
+from storage import ensure_board_schema, upsert_articles, lookup_article_ids, store_article_pushes
+from maintenance import maintain_board
+
+
+class LeaseLost(Exception):
+    """工作的租約已過期並被其他工作者認領。"""
+
+
+def store_article_batch(conn, board: str, articles_df: pd.DataFrame, pushes_df: pd.DataFrame,
+                        lexicon=None) -> list:
+    """
+    寫入一批已抓取並計分的文章與推文；重複寫入同一批文章的結果相同。
+
+    返回:
+        寫入的文章 id（早於已彙總時段而被略過的文章不包含在內）
+    """
+    ensure_board_schema(conn, board)
+    if articles_df.empty:
+        return []
+    upsert_articles(conn, board, articles_df, lexicon)
+    store_article_pushes(conn, board, articles_df, pushes_df)
+    return lookup_article_ids(conn, board, articles_df).dropna().astype(int).tolist()
+
+
+class IngestWorker:
+    """
+    單一工作者：重複認領工作並處理，直到佇列清空（once=True）或被中斷。
+
+    所有佇列操作與寫入都經由 db（見 db.py）的單一寫入執行緒；處理期間每抓一頁或一篇文章
+    就延長一次租約，租約被其他工作者取走時放棄本次結果。
+    """
+
+    def __init__(self, db, worker_id: str = None, boards: list = None,
+                 lease_seconds: float = INGEST_LEASE_SECONDS,
+                 retry_delay: float = INGEST_RETRY_DELAY_SECONDS,
+                 max_attempts: int = INGEST_MAX_ATTEMPTS,
+                 batch_size: int = INGEST_ARTICLE_BATCH_SIZE,
+                 request_delay: float = INGEST_REQUEST_DELAY):
+        self.db = db
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.boards = boards
+        self.lease_seconds = lease_seconds
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+        self.batch_size = batch_size
+        self.request_delay = request_delay
+        self.session = create_session()
+        self.db.write(ensure_jobs_schema)
+
+    def log(self, message: str):
+        print(f"[{self.worker_id}] {message}", flush=True)
+
+    def run(self, once: bool = False, idle_sleep: float = 5.0) -> int:
+        """返回: 處理的工作數"""
+        processed = 0
+        while True:
+            job = self.db.write(claim, self.worker_id, self.lease_seconds, self.boards)
+            if job is None:
+                if once:
+                    return processed
+                time.sleep(idle_sleep)
+                continue
+            self.process(job)
+            processed += 1
+
+    def process(self, job):
+        self.log(f"開始 {job}")
+        try:
+            if job.kind == 'pages':
+                result = self.run_pages(job)
+            else:
+                result = self.run_articles(job)
+        except LeaseLost:
+            self.log(f"{job} 的租約已被取走，放棄本次結果")
+            return
+        except Exception as e:
+            status = self.db.write(fail, job, self.worker_id, f"{type(e).__name__}: {e}", self.retry_delay)
+            self.log(f"{job} 失敗（{status or '租約已失效'}）：{e}")
+            return
+        if self.db.write(complete, job, self.worker_id):
+            self.log(f"完成 {job}：{result}")
+
+    def _extend_lease(self, job):
+        if not self.db.write(heartbeat, job, self.worker_id, self.lease_seconds):
+            raise LeaseLost()
+
+    def _get(self, url: str):
+        res = self.session.get(url, timeout=15)
+        res.raise_for_status()
+        return res
+
+    def run_pages(self, job) -> str:
+        """解析列表頁，將文章展開為文章批次工作。"""
+        articles = []
+        for page in range(job.payload['first'], job.payload['last'] + 1):
+            page_articles, _ = parse_index_page(self._get(index_page_url(job.board, page)).text)
+            articles.extend([a['url'], a['title'], a['author']] for a in page_articles)
+            self._extend_lease(job)
+            time.sleep(self.request_delay)
+
+        def enqueue_batches(conn):
+            return sum(
+                enqueue(conn, job.board, 'articles', {'articles': articles[i:i + self.batch_size]}, self.max_attempts)
+                for i in range(0, len(articles), self.batch_size)
+            )
+        queued = self.db.write(enqueue_batches)
+        return f"{len(articles)} 篇文章，排入 {queued} 個文章批次工作"
+
+    def run_articles(self, job) -> str:
+        """抓取、解析並計分一批文章後寫入。"""
+        from sentiment_analyzer import (
+            get_sentiment_model, get_active_lexicon, load_repost_history, analyze_sentiment_batch, analyze_push_batch
+        )
+
+        articles, pushes = [], []
+        for url, title, author in job.payload['articles']:
+            article, article_pushes = fetch_article(self.session, job.board, url, title, author)
+            if article is not None:
+                # 只取代確實抓到的文章的推文；已刪除或無法解析的文章保留原有推文
+                articles.append(article)
+                pushes.extend(article_pushes)
+            self._extend_lease(job)
+            time.sleep(self.request_delay)
+
+        model, lexicon = get_sentiment_model(job.board), get_active_lexicon()
+        articles_df = pd.DataFrame(articles)
+        # 與已寫入的文章比對轉貼，不限於這一批
+        with self.db.connection() as conn:
+            history = load_repost_history(conn, job.board, articles_df)
+        articles_df = analyze_sentiment_batch(articles_df, model, show_progress=False, history=history)
+        pushes_df = analyze_push_batch(pd.DataFrame(pushes))
+        # 計分可能耗時，寫入前確認租約仍有效
+        self._extend_lease(job)
+        article_ids = self.db.write(store_article_batch, job.board, articles_df, pushes_df, lexicon)
+        if not article_ids:
+            return "沒有可寫入的文章"
+        # 其他行程可能已把看板同步到較新的詞典；此時這批文章會改用看板的詞典重新計分，而不是退回舊詞典
+        maintenance = self.db.write(
+            maintain_board, job.board, lexicon if model.name == 'lexicon' else None, article_ids=article_ids
+        )
+        return (f"寫入 {len(article_ids)} 篇文章、{len(pushes_df)} 則推文，"
+                f"重新計分 {maintenance['rescored']} 篇，新警示 {len(maintenance['alerts'])} 個")
+
+
+def _run_worker(db_path: str, boards: list, once: bool):
+    worker = IngestWorker(get_database(db_path, pool_size=DB_POOL_SIZE), boards=boards)
+    worker.log(f"已啟動，處理看板：{', '.join(boards) if boards else '全部'}")
+    try:
+        worker.run(once=once)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        worker.db.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PTT 分散式擷取工作者")
+    parser.add_argument('--db', default='ptt_cache.db', help="SQLite 資料庫路徑（所有工作者共用）")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    enqueue_parser = commands.add_parser('enqueue', help="排入列表頁範圍工作")
+    enqueue_parser.add_argument('board')
+    enqueue_parser.add_argument('--pages', type=int, default=10, help="從最新一頁往前的頁數")
+    enqueue_parser.add_argument('--first', type=int, help="起始頁碼（與 --last 一起使用時忽略 --pages）")
+    enqueue_parser.add_argument('--last', type=int, help="結束頁碼")
+    enqueue_parser.add_argument('--pages-per-job', type=int, default=2)
+
+    run_parser = commands.add_parser('run', help="啟動工作者")
+    run_parser.add_argument('--boards', nargs='*', help="只認領這些看板的工作")
+    run_parser.add_argument('--processes', type=int, default=1, help="本機啟動的工作者行程數")
+    run_parser.add_argument('--once', action='store_true', help="佇列清空後結束")
+
+    commands.add_parser('status', help="顯示各看板的工作數")
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        if args.processes <= 1:
+            _run_worker(args.db, args.boards, args.once)
+            return
+        # 每個行程在啟動後才建立自己的連線池與寫入執行緒
+        context = multiprocessing.get_context('spawn')
+        processes = [
+            context.Process(target=_run_worker, args=(args.db, args.boards, args.once))
+            for _ in range(args.processes)
+        ]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.join()
+        return
+
+    db = get_database(args.db, pool_size=DB_POOL_SIZE)
+    try:
+        db.write(ensure_jobs_schema)
+        if args.command == 'enqueue':
+            if args.first is not None and args.last is not None:
+                first, last = args.first, args.last
+            else:
+                last = latest_index_page(create_session(), args.board)
+                first = max(1, last - args.pages + 1)
+            queued = db.write(enqueue_page_ranges, args.board, first, last, args.pages_per_job, INGEST_MAX_ATTEMPTS)
+            print(f"已排入 {args.board} 第 {first}～{last} 頁，共 {queued} 個工作")
+        else:
+            with db.connection() as conn:
+                counts = job_counts(conn)
+            if not counts:
+                print("佇列中沒有工作")
+            for (board, status), count in counts.items():
+                print(f"{board}\t{status}\t{count}")
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])